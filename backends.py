@@ -0,0 +1,160 @@
+"""Capture and scroll backends: the live screen, a recorder and a replayer."""
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import controls
+
+class LiveBackend():
+    """Grab the screen and scroll with the mouse wheel, pausing up to `sleep` seconds per notch"""
+    def __init__(self, sleep=.05):
+        self.sleep = sleep
+
+    def grab(self, rect):
+        return controls.screengrab(rect)
+
+    def scroll(self, rect, notches):
+        controls.screenscroll(rect, notches, sleep=self.sleep)
+
+    def close(self):
+        controls.close()
+
+class RecordingBackend():
+    """
+    Pass everything through to `backend` and record it in a session directory:
+    every grabbed frame as a PNG and every grab and scroll as a line in session.jsonl.
+    Frames are encoded on a background thread to stay out of the capture loop.
+    """
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+        self.frame = 0
+        os.makedirs(os.path.join(path, 'frames'), exist_ok=True)
+        self.events = open(os.path.join(path, 'session.jsonl'), 'w', encoding='utf-8')
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recorder')
+
+    def _event(self, **event):
+        event['time'] = time.time()
+        self.events.write(json.dumps(event) + '\n')
+
+    def grab(self, rect):
+        image = self.backend.grab(rect)
+        name = f'{self.frame:06d}.png'
+        self.writer.submit(image.save, os.path.join(self.path, 'frames', name))
+        self._event(event='grab', rect=list(rect), frame=name)
+        self.frame += 1
+        return image
+
+    def scroll(self, rect, notches):
+        self.backend.scroll(rect, notches)
+        self._event(event='scroll', rect=list(rect), notches=notches)
+
+    def close(self):
+        self.writer.shutdown(wait=True)
+        self.events.close()
+        self.backend.close()
+
+class ReplayBackend():
+    """
+    Serve recorded frames in order, one per grab, without touching the screen or sleeping.
+    Frames come from a packed, memory-mapped frames.npy when the session has one,
+    and from the PNGs otherwise. Once the recording runs out the last frame is
+    repeated, like a page that no longer scrolls.
+    """
+    def __init__(self, path=None, images=None, preload=False):
+        self.path = path
+        self.rect = None
+        self.index = 0
+        self.scrolls = 0
+        self.frames = None
+        self.names = []
+
+        if images is not None:
+            self.frames = list(images)
+            return
+
+        for event in read_session(path):
+            if event['event'] == 'grab':
+                self.names.append(event['frame'])
+                self.rect = self.rect or event['rect']
+
+        packed = os.path.join(path, 'frames.npy')
+        if os.path.exists(packed):
+            self.frames = np.load(packed, mmap_mode='r')
+        elif preload:
+            self.frames = [self._read(i) for i in range(len(self.names))]
+
+    @classmethod
+    def from_images(cls, images):
+        """Replay frames that are already in memory"""
+        return cls(images=images)
+
+    def __len__(self):
+        return len(self.frames) if self.frames is not None else len(self.names)
+
+    def _read(self, index):
+        with Image.open(os.path.join(self.path, 'frames', self.names[index])) as image:
+            return image.convert('RGB')
+
+    def grab(self, rect):
+        index = min(self.index, len(self) - 1)
+        self.index += 1
+        if self.frames is None:
+            return self._read(index)
+        frame = self.frames[index]
+        if isinstance(frame, np.ndarray):
+            return Image.fromarray(np.asarray(frame))
+        return frame
+
+    def scroll(self, rect, notches):
+        self.scrolls += 1
+
+    @property
+    def exhausted(self):
+        return self.index >= len(self)
+
+    def close(self):
+        pass
+
+def read_session(path):
+    """Events of a recorded session"""
+    with open(os.path.join(path, 'session.jsonl'), 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def pack(path):
+    """Stack the PNG frames of a session into frames.npy for memory-mapped replay"""
+    replay = ReplayBackend(path)
+    first = np.asarray(replay._read(0))
+    frames = np.lib.format.open_memmap(
+        os.path.join(path, 'frames.npy'),
+        mode='w+',
+        dtype=np.uint8,
+        shape=(len(replay), *first.shape)
+        )
+    for i in range(len(replay)):
+        frames[i] = np.asarray(replay._read(i))
+    frames.flush()
+    return len(replay)
+
+def get_backend(args):
+    """Live, render-settling (--settle), recording (--record) or replaying (--replay) backend"""
+    if args.replay:
+        return ReplayBackend(args.replay)
+    if args.settle:
+        from controller import SettlingBackend
+        backend = SettlingBackend(LiveBackend(sleep=0), timeout=args.settle_timeout)
+    else:
+        backend = LiveBackend()
+    if args.record:
+        backend = RecordingBackend(backend, args.record)
+    return backend
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3 or sys.argv[1] != 'pack':
+        sys.exit(f"{sys.argv[0]}: python backends.py pack <session>")
+    print(f"Packed {pack(sys.argv[2])} frames")
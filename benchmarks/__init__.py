@@ -0,0 +1,10 @@
+"""Benchmarks, run from the repository root with `python -m benchmarks.<name>`"""
+import Levenshtein
+
+def cer(reference:str, hypothesis:str) -> float:
+    """Character error rate of `hypothesis` against `reference`, whitespace runs count as one space"""
+    reference = ' '.join(reference.split())
+    hypothesis = ' '.join(hypothesis.split())
+    if not reference:
+        return float(bool(hypothesis))
+    return Levenshtein.distance(reference, hypothesis) / len(reference)
@@ -0,0 +1,92 @@
+"""
+Compare per-call OCR latency of the engines in `ocr` on a folder of saved screen grabs.
+
+python -m benchmarks.ocr_latency ./data/frames --workers=4 --repeat=3
+"""
+import os
+import sys
+import argparse
+import time
+import statistics
+
+from PIL import Image
+import pytesseract
+
+from ocr import get_engine, ENGINES
+
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+def load_images(folder):
+    """Load every image in `folder` into memory, sorted by name"""
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(EXTENSIONS))
+    images = []
+    for name in names:
+        with Image.open(os.path.join(folder, name)) as image:
+            images.append(image.convert('RGB'))
+    return images
+
+def report(label, latencies, wall=None):
+    """Print latency statistics in milliseconds"""
+    ms = [1000*t for t in latencies]
+    line = (
+        f"{label:<28} n={len(ms):<4} "
+        f"mean={statistics.mean(ms):8.1f}ms "
+        f"median={statistics.median(ms):8.1f}ms "
+        f"max={max(ms):8.1f}ms"
+        )
+    if wall is not None:
+        line += f"  throughput={len(ms)/wall:6.2f} images/s"
+    print(line, flush=True)
+
+def blocking(call, images, repeat):
+    """Time `call` image by image"""
+    latencies = []
+    for _ in range(repeat):
+        for image in images:
+            start = time.perf_counter()
+            call(image)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+def batch(engine, images, repeat):
+    """Time the whole batch through the engine's worker pool"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        engine.map(images)
+    wall = time.perf_counter() - start
+    return [wall / (repeat*len(images))] * (repeat*len(images)), wall
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", help="Folder with saved screen grabs")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument("--workers", default=2, type=int)
+    parser.add_argument("--lang", default='eng', type=str)
+    parser.add_argument("--repeat", default=1, type=int)
+    args = parser.parse_args()
+
+    images = load_images(args.folder)
+    if not images:
+        sys.exit(f"No images found in {args.folder}")
+
+    # Current path in run.py
+    report(
+        "pytesseract.image_to_string",
+        blocking(lambda im: pytesseract.image_to_string(im, lang=args.lang), images, args.repeat)
+        )
+
+    for name in args.engines:
+        try:
+            engine = get_engine(name, workers=args.workers, lang=args.lang)
+        except ImportError as error:
+            print(f"{name:<28} skipped: {error}")
+            continue
+        with engine:
+            # First call loads the language data, keep it out of the numbers
+            engine.image_to_string(images[0])
+            report(f"{name} blocking", blocking(engine.image_to_string, images, args.repeat))
+            latencies, wall = batch(engine, images, args.repeat)
+            report(f"{name} batch x{args.workers}", latencies, wall)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compare the preprocessing presets in `preprocess` on a folder of recorded frames.
+Reports the preprocessing and OCR latency per frame for every preset, and the
+character error rate against `<frame>.txt` ground truth where it exists, or
+against the text read from the raw frame otherwise.
+
+python -m benchmarks.preprocessing ./data/sessions/book/frames --engine=tesserocr
+"""
+import sys
+import argparse
+import time
+import statistics
+
+from ocr import get_engine, ENGINES
+from preprocess import Preprocessor, PRESETS
+from benchmarks.ocr_latency import load_images
+from benchmarks.tiling import load_truth, mean_cer
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", help="Folder with recorded frames")
+    parser.add_argument("--engine", choices=['auto', *ENGINES], default='auto')
+    parser.add_argument("--presets", nargs="+", choices=list(PRESETS), default=list(PRESETS))
+    parser.add_argument("--lang", default='eng', type=str)
+    parser.add_argument("--repeat", default=1, type=int)
+    args = parser.parse_args()
+
+    images = load_images(args.folder)
+    if not images:
+        sys.exit(f"No images found in {args.folder}")
+    truth = load_truth(args.folder)
+
+    print(f"{'preset':<10}{'preprocess':>12}{'OCR':>10}{'total':>10}{'CER':>9}  reference")
+    raw = None
+    with get_engine(args.engine, workers=1, lang=args.lang) as engine:
+        # First call loads the language data, keep it out of the numbers
+        engine.read(images[0])
+
+        for name in ['none', *(p for p in args.presets if p != 'none')]:
+            preprocess = Preprocessor.from_preset(name)
+            cleaning, reading = [], []
+            for _ in range(args.repeat):
+                texts = []
+                for image in images:
+                    start = time.perf_counter()
+                    if preprocess is not None:
+                        image = preprocess(image)
+                    cleaned = time.perf_counter()
+                    texts.append(engine.read(image))
+                    cleaning.append(cleaned - start)
+                    reading.append(time.perf_counter() - cleaned)
+            if raw is None:
+                raw = texts
+
+            against_truth = mean_cer(truth, texts)
+            error, reference = (against_truth, 'truth') if against_truth is not None else (mean_cer(raw, texts), 'raw frame')
+            clean_ms, read_ms = 1000*statistics.mean(cleaning), 1000*statistics.mean(reading)
+            print(
+                f"{name:<10}{clean_ms:>10.1f}ms{read_ms:>8.1f}ms{clean_ms+read_ms:>8.1f}ms{error:>9.2%}  {reference}",
+                flush=True
+                )
+
+if __name__ == "__main__":
+    main()
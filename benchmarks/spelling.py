@@ -0,0 +1,64 @@
+"""
+Compare pyspellchecker with the precomputed SymSpell index on OCR-like misspellings.
+
+python -m benchmarks.spelling --language=nl --words=200
+"""
+import argparse
+import random
+import time
+
+from spellchecker import SpellChecker
+
+from symspell import SymSpellIndex
+
+CONFUSIONS = 'abcdefghijklmnopqrstuvwxyz0158'
+
+def misspell(word, rng, max_edits=2):
+    """Replace up to `max_edits` characters, as OCR tends to"""
+    chars = list(word)
+    for _ in range(rng.randint(0, max_edits)):
+        chars[rng.randrange(len(chars))] = rng.choice(CONFUSIONS)
+    return ''.join(chars)
+
+def timed(call, words):
+    start = time.perf_counter()
+    results = [call(w) for w in words]
+    return results, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--language", default='nl', type=str)
+    parser.add_argument("--words", default=200, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # Startup
+    start = time.perf_counter()
+    spell = SpellChecker(language=args.language)
+    print(f"pyspellchecker load   {time.perf_counter() - start:8.3f}s")
+
+    start = time.perf_counter()
+    SymSpellIndex.for_language(args.language)
+    print(f"symspell first load   {time.perf_counter() - start:8.3f}s (builds the index if it is not cached)")
+
+    start = time.perf_counter()
+    index = SymSpellIndex.for_language(args.language)
+    print(f"symspell cached load  {time.perf_counter() - start:8.3f}s")
+
+    # Lookups
+    vocabulary = sorted(w for w in spell.word_frequency.dictionary if len(w) > 2)
+    queries = [misspell(w, rng) for w in rng.sample(vocabulary, args.words)]
+
+    expected, slow = timed(spell.correction, queries)
+    found, fast = timed(index.correction, queries)
+    agree = sum(a == b for a, b in zip(expected, found)) / len(queries)
+    known = sum((q in spell) == (q in index) for q in queries) / len(queries)
+
+    print(f"pyspellchecker        {1000*slow/len(queries):8.3f}ms per correction")
+    print(f"symspell              {1000*fast/len(queries):8.3f}ms per correction, {slow/fast:.0f}x faster")
+    print(f"same correction       {agree:8.1%}")
+    print(f"same known/unknown    {known:8.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+End-to-end benchmark on synthetic scrolling documents.
+Known text is rendered into a tall page that scrolls under a region of
+`--rect` like a screen does, `--page_notchpixels` pixels per notch, and read
+through the full capture loop of run.py: OCR, merging, end-of-document
+detection and output. Every combination of document length, font, font size
+and noise level is one case.
+Reports pages per second, new characters per OCR call, per-stage latency
+percentiles, peak Python memory and the character error rate against the
+rendered text. `--save` writes the
+results as a JSON baseline, `--compare` checks them against one and exits with
+status 1 when a case got slower or less accurate than the tolerances allow.
+Options after `--` are passed on to run.py.
+
+python -m benchmarks.synthetic --save ./data/synthetic.json -- --ocr_engine=tesserocr --lang=nld
+python -m benchmarks.synthetic --compare ./data/synthetic.json -- --ocr_engine=tesserocr --lang=nld --fast_overlap
+"""
+import os
+import gc
+import sys
+import json
+import random
+import argparse
+import itertools
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from spellchecker import SpellChecker
+
+import run
+from controls import datafolder
+from startup import StartupProfile
+from timer import tracker
+from benchmarks import cer
+
+# Stages shown in the table, every stage is in the JSON
+STAGES = ('From screengrab to string', 'Wait for OCR', 'align_sequences', 'End check')
+
+def vocabulary(language, size=5000):
+    """The `size` most common words of the spelling dictionary and their frequencies"""
+    dictionary = SpellChecker(language=language).word_frequency.dictionary
+    words = sorted(((w, n) for w, n in dictionary.items() if w.isalpha()), key=lambda item: -item[1])[:size]
+    return [w for w, _ in words], [n for _, n in words]
+
+def make_paragraphs(words, weights, count, rng):
+    """`count` words as paragraphs of sentences, each paragraph a list of words"""
+    paragraphs = []
+    left = count
+    while left > 0:
+        paragraph = []
+        for _ in range(rng.randint(3, 6)):
+            sentence = rng.choices(words, weights, k=min(left, rng.randint(5, 15)))
+            if not sentence:
+                break
+            left -= len(sentence)
+            sentence[0] = sentence[0].capitalize()
+            sentence[-1] += '.'
+            paragraph.extend(sentence)
+        paragraphs.append(paragraph)
+    return paragraphs
+
+def load_font(name, size):
+    """A TrueType font by file or name, PIL's own font when it cannot be found"""
+    try:
+        return ImageFont.truetype(name, size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+def wrap(paragraphs, font, width):
+    """Lines that fit `width` pixels, with an empty line between paragraphs"""
+    lines = []
+    for paragraph in paragraphs:
+        if lines:
+            lines.append('')
+        line = ''
+        for word in paragraph:
+            candidate = f"{line} {word}" if line else word
+            if line and font.getlength(candidate) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+def render(lines, font, size, width, margin=16):
+    """The whole document as one tall grayscale page"""
+    spacing = int(1.5*size)
+    height = 2*margin + spacing*len(lines)
+    page = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i*spacing), line, fill=0, font=font)
+    return page
+
+class ScrollingPage():
+    """
+    Backend showing a region `height` pixels high of a tall page, that moves
+    `notchpixels` pixels per scrolled notch and stops at the bottom of the page
+    like a real one. Every grab gets its own gaussian noise of `noise` grey levels.
+    """
+    def __init__(self, page, height, notchpixels, noise=0., seed=1):
+        self.pixels = np.asarray(page)
+        self.height = height
+        self.notchpixels = notchpixels
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.offset = 0
+        self.bottom = max(0, page.height - height)
+        self.grabs = 0
+        self.overrun = 0
+        self.shown_bottom = False
+
+    def grab(self, rect):
+        # Grabs after the bottom was shown, the end check should stop right there
+        self.overrun += self.shown_bottom
+        offset = min(int(self.offset), self.bottom)
+        self.shown_bottom = offset == self.bottom
+        self.grabs += 1
+
+        frame = self.pixels[offset:offset+self.height].astype(np.float32)
+        if self.noise:
+            frame += self.rng.normal(0, self.noise, frame.shape).astype(np.float32)
+        frame = np.clip(frame, 0, 255).astype(np.uint8)
+        return Image.fromarray(frame).convert('RGB')
+
+    def scroll(self, rect, notches):
+        self.offset += notches*self.notchpixels
+
+    def close(self):
+        pass
+
+def replay(screen, options):
+    """Run run.py's capture loop on a fresh backend from `screen()`, returns the parsed options and the backend"""
+    args = run.build_parser().parse_args(options)
+
+    # Built fresh every time, so no run starts with caches warmed by another
+    engine = run.warmup(args, StartupProfile())
+    backend = screen()
+
+    tracker.reset()
+    gc.collect()
+    try:
+        if args.mode == 'pipelined':
+            run.pipelined(args, engine, backend)
+        else:
+            run.sequential(args, engine, backend)
+    finally:
+        engine.close()
+    return args, backend
+
+def run_case(name, screen, truth, options, memory):
+    """Capture from `screen()` and measure throughput, stage latencies, memory and accuracy"""
+    options = [*options, '--title', f"synthetic-{name}"]
+
+    start = time.perf_counter()
+    args, backend = replay(screen, options)
+    elapsed = time.perf_counter() - start
+    stages = tracker.snapshot()['timings']
+    counts = dict(tracker.counts)
+
+    with open(f"{datafolder}{args.title}.txt", 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    # Tracing allocations slows the merge down many times over, so measure it in a run of its own
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            replay(screen, options)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # Every changed frame is one OCR call
+    pages = counts.get('Frames: changed', 0)
+    return {
+        'grabs': backend.grabs,
+        'pages': pages,
+        'seconds': elapsed,
+        'pages_per_second': pages / elapsed,
+        'overrun': backend.overrun,
+        'new_characters_per_page': counts.get('Scroll: new characters', 0) / pages if pages else 0.,
+        'peak_memory': peak,
+        'cer': cer(truth, text),
+        'stages': stages,
+        'counts': counts,
+        }
+
+def compare(baseline, results, slower, worse):
+    """Descriptions of every case that regressed against `baseline`"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline['cases'].get(name)
+        if before is None:
+            continue
+        if result['pages_per_second'] < (1 - slower)*before['pages_per_second']:
+            regressions.append(f"{name}: {result['pages_per_second']:.2f} pages/s, was {before['pages_per_second']:.2f}")
+        for stage in STAGES:
+            now, then = result['stages'].get(stage), before['stages'].get(stage)
+            if now and then and now['p50'] > (1 + slower)*then['p50']:
+                regressions.append(f"{name}: {stage} p50 {1000*now['p50']:.1f}ms, was {1000*then['p50']:.1f}ms")
+        if result['cer'] > before['cer'] + worse:
+            regressions.append(f"{name}: CER {result['cer']:.2%}, was {before['cer']:.2%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", nargs="+", default=[1000, 5000], type=int, help="Words per document")
+    parser.add_argument("--fonts", nargs="+", default=['DejaVuSans.ttf'], type=str)
+    parser.add_argument("--font_sizes", nargs="+", default=[18], type=int)
+    parser.add_argument("--noise", nargs="+", default=[0., 12.], type=float, help="Standard deviation of the pixel noise in grey levels")
+    parser.add_argument("--rect", nargs=4, default=[200, 250, 560, 800], type=int, help="x y w h of the simulated region")
+    parser.add_argument("--page_notchpixels", default=None, type=float, help="Pixels the page really moves per notch, default is run.py's --notchpixels")
+    parser.add_argument("--language", default='nl', type=str, help="Dictionary the words are drawn from")
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--no_memory", action='store_true', help="Skip the second, memory traced run of every case")
+    parser.add_argument("--save", default=None, type=str, help="Write the results to this JSON baseline")
+    parser.add_argument("--compare", default=None, type=str, help="Check the results against this JSON baseline")
+    parser.add_argument("--slower", default=.2, type=float, help="Tolerated loss of throughput and stage p50 against the baseline")
+    parser.add_argument("--worse", default=.005, type=float, help="Tolerated increase of the CER against the baseline")
+    args, options = parser.parse_known_args()
+    options = [o for o in options if o != '--']
+
+    capture = run.build_parser().parse_args([*options, *map(str, args.rect)])
+    if run.scroll_notches(capture) <= 0:
+        sys.exit(f"A region of {args.rect[3]} pixels does not scroll with --notchpixels={capture.notchpixels}")
+    notchpixels = args.page_notchpixels or capture.notchpixels
+
+    words, weights = vocabulary(args.language)
+
+    print(f"{'case':<36}{'pages':>7}{'pages/s':>9}{'chars/page':>12}{'merge p50':>11}{'merge p95':>11}{'peak':>9}{'CER':>8}")
+    results = {}
+    for length, font_name, size, noise in itertools.product(args.lengths, args.fonts, args.font_sizes, args.noise):
+        name = f"{length}w-{os.path.splitext(os.path.basename(font_name))[0]}-{size}px-noise{noise:g}"
+        rng = random.Random(f"{args.seed}-{length}")
+
+        font = load_font(font_name, size)
+        lines = wrap(make_paragraphs(words, weights, length, rng), font, args.rect[2] - 32)
+        page = render(lines, font, size, args.rect[2])
+        screen = lambda: ScrollingPage(page, args.rect[3], notchpixels, noise, args.seed)
+
+        # The last words of the document, for the end check
+        final = ' '.join(' '.join(lines).split()[-6:])
+        result = run_case(name, screen, '\n'.join(lines), [*options, '--final_text', final, *map(str, args.rect)], not args.no_memory)
+        results[name] = result
+
+        merge = result['stages'].get('align_sequences', {})
+        peak = f"{result['peak_memory']/2**20:.0f}MB" if result['peak_memory'] is not None else '-'
+        print(
+            f"{name:<36}{result['pages']:>7}{result['pages_per_second']:>9.2f}{result['new_characters_per_page']:>12.0f}"
+            f"{1000*merge.get('p50', 0):>9.1f}ms{1000*merge.get('p95', 0):>9.1f}ms"
+            f"{peak:>9}{result['cer']:>8.2%}",
+            flush=True
+            )
+
+    if args.save:
+        baseline = {'time': time.time(), 'settings': vars(args), 'options': options, 'cases': results}
+        folder = os.path.dirname(args.save)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=1)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.slower, args.worse)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
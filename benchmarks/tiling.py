@@ -0,0 +1,84 @@
+"""
+Compare whole-frame OCR with line-band tiling on a folder of saved screen grabs.
+Reports the per-frame latency of both and the character error rate of the
+tiled text against the whole-frame text, and against `<frame>.txt` ground
+truth where it exists.
+
+python -m benchmarks.tiling ./data/frames --engine=tesserocr --tiles 2 4 8
+"""
+import os
+import sys
+import argparse
+import time
+import statistics
+
+from ocr import get_engine, ENGINES
+from benchmarks import cer
+from benchmarks.ocr_latency import EXTENSIONS, load_images
+
+def load_truth(folder):
+    """Ground truth text per frame, None where a frame has no .txt next to it"""
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(EXTENSIONS))
+    truth = []
+    for name in names:
+        path = os.path.join(folder, os.path.splitext(name)[0] + '.txt')
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                truth.append(f.read())
+        else:
+            truth.append(None)
+    return truth
+
+def read_all(engine, images, repeat):
+    """Texts and per-frame latencies of reading the frames one by one"""
+    latencies = []
+    for _ in range(repeat):
+        texts = []
+        for image in images:
+            start = time.perf_counter()
+            texts.append(engine.read(image))
+            latencies.append(time.perf_counter() - start)
+    return texts, latencies
+
+def mean_cer(references, hypotheses):
+    pairs = [(r, h) for r, h in zip(references, hypotheses) if r is not None]
+    if not pairs:
+        return None
+    return statistics.mean(cer(r, h) for r, h in pairs)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", help="Folder with saved screen grabs")
+    parser.add_argument("--engine", choices=['auto', *ENGINES], default='auto')
+    parser.add_argument("--tiles", nargs="+", default=[2, 4], type=int)
+    parser.add_argument("--lang", default='eng', type=str)
+    parser.add_argument("--repeat", default=1, type=int)
+    args = parser.parse_args()
+
+    images = load_images(args.folder)
+    if not images:
+        sys.exit(f"No images found in {args.folder}")
+    truth = load_truth(args.folder)
+
+    print(f"{'tiles':<8}{'median':>10}{'mean':>10}{'speedup':>9}{'CER vs whole':>14}{'CER vs truth':>14}")
+    baseline = None
+    for tiles in [1, *args.tiles]:
+        with get_engine(args.engine, workers=tiles, lang=args.lang, tiles=tiles) as engine:
+            # First call loads the language data, keep it out of the numbers
+            engine.read(images[0])
+            texts, latencies = read_all(engine, images, args.repeat)
+
+        median = statistics.median(latencies)
+        if baseline is None:
+            baseline = (texts, median)
+        against_whole = mean_cer(baseline[0], texts)
+        against_truth = mean_cer(truth, texts)
+        print(
+            f"{tiles:<8}{1000*median:>8.1f}ms{1000*statistics.mean(latencies):>8.1f}ms"
+            f"{baseline[1]/median:>8.2f}x{against_whole:>14.2%}"
+            f"{'-' if against_truth is None else f'{against_truth:.2%}':>14}",
+            flush=True
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Input control: wait for the screen to finish rendering instead of sleeping, and pick how far to scroll."""
+import time
+import asyncio
+import threading
+
+import numpy as np
+
+import controls
+from frames import signature
+from timer import tracker
+
+KEYS = {
+    'end': controls.press_end_key,
+    'home': controls.press_home_key,
+    'pagedown': controls.press_pagedown,
+    'pageup': controls.press_pageup,
+}
+
+class InputController():
+    """
+    Send input, then poll cheap thumbnails of the region until it has not
+    changed for `quiet` seconds.
+    The first look happens after the render latency measured on earlier inputs,
+    later looks every quarter of it, so fast pages are released to OCR quickly
+    and slow ones are not read half-drawn. The last, settled grab is returned,
+    so waiting does not cost an extra grab.
+    Time spent sleeping and grabbing is reported as 'Render wait: sleep' and
+    'Render wait: poll', to be set against the OCR and merge timings.
+    """
+    def __init__(self, backend, threshold=.002, timeout=1., latency=.05, quiet=.03, smoothing=.3, min_poll=.005, size=(32, 32)):
+        self.backend = backend
+        self.threshold = threshold
+        self.quiet = quiet
+        self.timeout = timeout
+        self.latency = latency
+        self.smoothing = smoothing
+        self.min_poll = min_poll
+        self.size = size
+        self.references = {}
+
+    def _signature(self, rect):
+        image = self.backend.grab(rect)
+        return image, signature(image, self.size)
+
+    @staticmethod
+    def _delta(a, b):
+        return float(np.mean(np.abs(a - b)))
+
+    async def settle(self, rect):
+        """Wait until `rect` is stable, returns the settled grab"""
+        reference = self.references.get(tuple(rect))
+        start = time.perf_counter()
+        slept = polled = 0.
+
+        # Nothing changes before the page has had time to render
+        wait = min(.8*self.latency, self.timeout)
+        await asyncio.sleep(wait)
+        slept += wait
+
+        previous = None
+        quiet_since = None
+        while True:
+            begin = time.perf_counter()
+            image, current = self._signature(rect)
+            polled += time.perf_counter() - begin
+            elapsed = time.perf_counter() - start
+
+            moved = reference is None or self._delta(current, reference) > self.threshold
+            if previous is None or self._delta(current, previous) > self.threshold:
+                quiet_since = None
+            elif quiet_since is None:
+                # Unchanged since the previous poll
+                quiet_since = elapsed - self.poll
+            stable = quiet_since is not None and elapsed - quiet_since >= self.quiet
+            if stable and (moved or elapsed >= 2*self.latency):
+                if moved:
+                    self.latency += self.smoothing*(max(quiet_since, self.min_poll) - self.latency)
+                break
+            if elapsed >= self.timeout:
+                tracker.count('Render wait: timeouts')
+                break
+
+            previous = current
+            await asyncio.sleep(self.poll)
+            slept += self.poll
+
+        self.references[tuple(rect)] = current
+        tracker.add('Render wait: sleep', slept)
+        tracker.add('Render wait: poll', polled)
+        return image
+
+    @property
+    def poll(self):
+        return max(self.min_poll, self.latency/4)
+
+    def remember(self, rect, image):
+        """Use `image` as the last known state of `rect`"""
+        self.references[tuple(rect)] = signature(image, self.size)
+
+    async def scroll(self, rect, notches):
+        """Scroll `rect`, the backend should not sleep itself"""
+        self.backend.scroll(rect, notches)
+
+    async def press(self, key, rect):
+        """Press 'end', 'home', 'pagedown' or 'pageup' and wait for `rect` to settle"""
+        KEYS[key](sleep=0)
+        return await self.settle(rect)
+
+    async def advance(self, rect, notches):
+        """Scroll and return the settled frame"""
+        await self.scroll(rect, notches)
+        return await self.settle(rect)
+
+class SettlingBackend():
+    """
+    Backend whose grabs wait for the region to settle after a scroll.
+    An `InputController` runs on an event loop in a thread of its own. A scroll
+    starts settling its region right away and the next grab of that region
+    waits for it, so while one region renders the capture thread can grab and
+    scroll the others, and their waits overlap. All screen access happens on
+    the loop's thread.
+    """
+    def __init__(self, backend, **kwargs):
+        self.backend = backend
+        self.controller = InputController(backend, **kwargs)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='settle', daemon=True)
+        self.thread.start()
+
+        # Settle tasks of the regions scrolled since their last grab
+        self.settling = {}
+
+    def _call(self, coroutine):
+        """Run `coroutine` on the loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _grab(self, rect):
+        settling = self.settling.pop(tuple(rect), None)
+        if settling is not None:
+            return await settling
+        image = self.backend.grab(rect)
+        self.controller.remember(rect, image)
+        return image
+
+    async def _scroll(self, rect, notches):
+        previous = self.settling.pop(tuple(rect), None)
+        if previous is not None:
+            previous.cancel()
+        await self.controller.scroll(rect, notches)
+        self.settling[tuple(rect)] = self.loop.create_task(self.controller.settle(rect))
+
+    async def _cancel(self):
+        for settling in self.settling.values():
+            settling.cancel()
+        self.settling.clear()
+
+    def grab(self, rect):
+        return self._call(self._grab(rect))
+
+    def scroll(self, rect, notches):
+        self._call(self._scroll(rect, notches))
+
+    def close(self):
+        self._call(self._cancel())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.backend.close()
+
+class StepController():
+    """
+    Feedback control of the scroll step, in notches per page.
+    After every merged page `update` gets the fraction of the page that was
+    already seen before the scroll, measured from the merge seam or the scroll
+    registration, and steers the step towards keeping `target` of the page as
+    overlap. Scrolling too little OCRs mostly duplicate text, scrolling too far
+    leaves the alignment without overlap and it silently drops lines.
+    A merge that found no seam, or one matching less than `min_identity`, looks
+    like lost overlap, so the step is cut by `backoff` at once and only grows
+    back through the measurements. The step stays between `least` and `most`
+    notches, scrolling less than the tail the end check compares would look
+    like the end of the document.
+    With `adaptive` off the step stays put and only the new text is counted.
+    """
+    def __init__(self, notches, most, least=1, target=.5, min_identity=.8, gain=.5, backoff=.5, adaptive=True):
+        self.step = float(notches)
+        self.most = most
+        self.least = least
+        self.target = target
+        self.min_identity = min_identity
+        self.gain = gain
+        self.backoff = backoff
+        self.adaptive = adaptive
+        self.pages = 0
+        self.added = 0
+        self.backoffs = 0
+
+    @property
+    def notches(self):
+        return round(self.step)
+
+    def update(self, scrolled, overlap, identity, added):
+        """
+        Feed back one merged page: the notches `scrolled` since the previous
+        page, the fraction of the page seen before (None when no seam was
+        found), the `identity` of the seam and the characters the page `added`
+        to the document. Returns the notches for the next scroll.
+        """
+        self.pages += 1
+        self.added += added
+        tracker.count('Scroll: new characters', added)
+        if not self.adaptive or not scrolled:
+            return self.notches
+
+        if overlap is None or overlap <= 0 or identity < self.min_identity:
+            self.step = max(self.least, self.backoff*self.step)
+            self.backoffs += 1
+            tracker.count('Scroll: back off')
+            return self.notches
+
+        # `scrolled` notches moved 1 - overlap of the page, aim for 1 - target,
+        # but at most double, a page that hardly moved may just have rendered late
+        wanted = min(scrolled * (1 - self.target) / max(1 - overlap, .01), 2*scrolled)
+        self.step += self.gain*(wanted - self.step)
+        self.step = min(max(self.step, self.least), self.most)
+        return self.notches
+
+    def efficiency(self):
+        """New characters per OCR call"""
+        return self.added / self.pages if self.pages else 0.
+
+    def report(self):
+        return (
+            f"{self.efficiency():.0f} new characters per OCR call over {self.pages} pages, "
+            f"scrolling {self.notches} notches, {self.backoffs} back-offs"
+            )
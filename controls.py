@@ -4,12 +4,16 @@ import re
 import sys
 import random
 import math
+import json
 
 from PIL import ImageGrab
-import regex
-import pyautogui
-import win32api
-import win32con
+
+try:
+    import win32api
+    import win32con
+except ImportError:
+    # Live mouse and keyboard input needs Windows, replayed sessions run without
+    win32api = win32con = None
 
 datafolder = './data/'
 
@@ -20,7 +24,7 @@ def mouseto(x, y, sleep=.05):
 
 def mouseclick(x, y, sleep=.05):
     # Simulate left mouse button click
-    mouseto(x, y)
+    mouseto(x, y, sleep)
     win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, 0, 0, 0, 0)
     win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP, 0, 0, 0, 0)
     time.sleep(sleep*random.random())  # slight delay to ensure click is registered
@@ -59,12 +63,20 @@ def screenscroll( rect, notches, sleep=.05 ):
     x, y, width, height = rect
     xs, ys = random.randint(x, width), random.randint(y, height)
     # Scroll down
-    mouseclick(xs, ys)  # Focus screen
+    mouseclick(xs, ys, sleep)  # Focus screen
     for _ in range(notches):
         xs, ys = random.randint(x, width), random.randint(y, height)
         scroll(xs, ys)
         time.sleep(sleep*random.random())
 
+def screensize():
+    """Width and height of the primary screen, without starting a GUI toolkit"""
+    if sys.platform == 'win32':
+        import ctypes
+        user32 = ctypes.windll.user32
+        return user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+    return ImageGrab.grab().size
+
 def screengrab( rect ):
     """ Given a rectangle, return a PIL Image of that part of the screen.
     Handles a Linux installation with and older Pillow by falling-back
@@ -78,6 +90,7 @@ def screengrab( rect ):
 
 def alttab():
     """Press alt-tab"""
+    import pyautogui
     pyautogui.keyDown('alt')
     time.sleep(.2)
     pyautogui.press('tab')
@@ -95,7 +108,18 @@ def save_txt(text, filename):
         f.write(text)
 
 def load_txt(filename):
-    """Load text from a .txt file"""
-    with open(f"{datafolder}{filename}.txt", 'r', encoding='utf-8') as f:
-        text = f.read()
-    return text
+    """Load text from a .txt file, including the uncommitted tail of an interrupted capture"""
+    checkpoint = load_checkpoint(filename)
+    with open(f"{datafolder}{filename}.txt", 'rb') as f:
+        if checkpoint is None:
+            return f.read().decode('utf-8')
+        committed = f.read(checkpoint['offset']).decode('utf-8')
+    return committed + checkpoint['tail']
+
+def load_checkpoint(filename):
+    """Load the sidecar checkpoint of a streamed .txt file, None if there is none"""
+    try:
+        with open(f"{datafolder}{filename}.ckpt.json", 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
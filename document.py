@@ -0,0 +1,126 @@
+"""Incremental buffer for the merged document."""
+
+class DocumentBuffer():
+    """
+    Merged text kept as append-only frozen chunks plus a mutable tail.
+    Alignment only ever sees the tail, so the cost of merging a page does not
+    depend on how much of the document has been captured. Text that falls more
+    than `keep` characters behind the end is frozen at a word boundary and can
+    be streamed out with `pop_committed`.
+    """
+    def __init__(self, text="", keep=0, margin=2):
+        self.chunks = []
+        self.frozen_length = 0
+        self.keep = keep
+        self.margin = margin
+        self._tail = text
+        self._popped = 0
+
+        # Lowest position replaced since `rewritten` was last called
+        self._low_water = 0
+
+    @classmethod
+    def from_text(cls, committed, tail, **kwargs):
+        """Resume from previously committed text and an uncommitted tail"""
+        document = cls(tail, **kwargs)
+        if committed:
+            document.chunks.append(committed)
+            document.frozen_length = len(committed)
+            document._popped = 1
+        return document
+
+    def __len__(self):
+        return self.frozen_length + len(self._tail)
+
+    def __str__(self):
+        return self.text()
+
+    def text(self):
+        """The whole document, O(document length)"""
+        return ''.join(self.chunks) + self._tail
+
+    def tail(self, size=None):
+        """The last `size` characters that can still change, or the whole tail"""
+        if size is None:
+            return self._tail
+        size = min(size, len(self._tail))
+        return self._tail[len(self._tail)-size:]
+
+    def word_window(self, size):
+        """`size` moved back so the last `size` characters start at the beginning of a word"""
+        cut = len(self._tail) - size
+        if cut <= 0:
+            return len(self._tail)
+        cut = max(self._tail.rfind(' ', 0, cut+1), self._tail.rfind('\n', 0, cut+1)) + 1
+        return len(self._tail) - cut
+
+    def line_window(self, lines):
+        """Size of the tail holding its last `lines` lines of text, blank lines not counted"""
+        size = -1
+        for line in reversed(self._tail.split('\n')):
+            if lines <= 0:
+                break
+            size += len(line) + 1
+            lines -= bool(line.strip())
+        return max(0, min(size, len(self._tail)))
+
+    def since(self, position):
+        """The document from `position` on, only touching the chunks it needs"""
+        if position >= self.frozen_length:
+            return self._tail[position-self.frozen_length:]
+        parts = [self._tail]
+        start = self.frozen_length
+        for chunk in reversed(self.chunks):
+            start -= len(chunk)
+            parts.append(chunk[max(0, position-start):])
+            if start <= position:
+                break
+        return ''.join(reversed(parts))
+
+    def replace_tail(self, size, text):
+        """Replace the last `size` characters with `text` and freeze what is out of reach"""
+        size = min(size, len(self._tail))
+        self._low_water = min(self._low_water, len(self) - size)
+        self._tail = self._tail[:len(self._tail)-size] + text
+
+        # Keep enough mutable text for the next page's window
+        self.keep = max(self.keep, int(self.margin*max(size, len(text))))
+        self._freeze()
+
+    def rewritten(self):
+        """
+        Lowest position replaced since the previous call, the end of the document
+        if nothing was. A merge rewrites a window of the tail and can leave it
+        shorter, so text before the previous end may have changed.
+        """
+        low, self._low_water = self._low_water, len(self)
+        return min(low, len(self))
+
+    def _freeze(self):
+        """Move everything but the last `keep` characters into the frozen chunks"""
+        cut = len(self._tail) - self.keep
+        if cut <= 0:
+            return
+
+        # Freeze whole words only
+        cut = max(self._tail.rfind(' ', 0, cut), self._tail.rfind('\n', 0, cut)) + 1
+        if cut <= 0:
+            return
+
+        chunk = self._tail[:cut]
+        self._tail = self._tail[cut:]
+        self.chunks.append(chunk)
+        self.frozen_length += len(chunk)
+
+    def pop_committed(self):
+        """Frozen text that has not been handed out yet"""
+        chunks = self.chunks[self._popped:]
+        self._popped = len(self.chunks)
+        return ''.join(chunks)
+
+    def flush(self):
+        """Freeze the whole tail, at the end of a capture"""
+        if self._tail:
+            self.chunks.append(self._tail)
+            self.frozen_length += len(self._tail)
+            self._tail = ""
@@ -1,11 +1,20 @@
 import re
+from collections import OrderedDict
+from typing import NamedTuple
 
-from spellchecker import SpellChecker
 import Levenshtein
-from Bio import Align
+import numpy as np
+
+try:
+    from rapidfuzz.process import cdist
+    from rapidfuzz.distance import Levenshtein as RapidLevenshtein
+except ImportError:
+    cdist = None
 
 from controls import *
 from timer import tracker
+from symspell import SymSpellIndex
+from matching import ApproximateMatcher
 
 DEFAULT_CORRECTIONS = {
     '0': 'O',  # zero to capital O
@@ -20,18 +29,178 @@ DEFAULT_CORRECTIONS = {
     # Add more based on your data
 }
 
+class LRUCache():
+    """Small least-recently-used cache with hit/miss counters"""
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+class OverlapDetector():
+    """
+    Fast path for finding the seam between the store tail and a new page.
+    Lines from the head of the new OCR text are looked up in the tail, exactly
+    first and then fuzzily, to estimate the alignment diagonal. Hits are
+    aligned within `band` characters of that diagonal by `banded_alignment`.
+    """
+    def __init__(self, band=16, anchors=3, min_anchor=8, max_error=.2, min_identity=.8):
+        self.band = band
+        self.anchors = anchors
+        self.min_anchor = min_anchor
+        self.max_error = max_error
+        self.min_identity = min_identity
+        self.stats = {'calls': 0, 'exact': 0, 'fuzzy': 0, 'miss': 0, 'fallback': 0}
+
+    def _record(self, outcome):
+        self.stats[outcome] += 1
+        tracker.count(f'Overlap: {outcome}')
+
+    def hit_rate(self):
+        """Fraction of calls that were merged on the fast path"""
+        if self.stats['calls'] == 0:
+            return 0.
+        hits = self.stats['exact'] + self.stats['fuzzy'] - self.stats['fallback']
+        return hits / self.stats['calls']
+
+    def anchor_lines(self, text:str):
+        """The first few lines of `text` that are long enough to anchor on, with their offsets"""
+        lines = []
+        offset = 0
+        for line in text.split('\n'):
+            if len(line.strip()) >= self.min_anchor:
+                lines.append((offset, line))
+                if len(lines) >= self.anchors:
+                    break
+            offset += len(line) + 1
+        return lines
+
+    def detect(self, str1:str, str2:str, expected=None):
+        """
+        Estimate the diagonal `p - q` along which str2[q] lines up with str1[p],
+        preferring the occurrence closest to the `expected` diagonal.
+        Returns None when no anchor is found.
+        """
+        self.stats['calls'] += 1
+        lines = self.anchor_lines(str2)
+
+        # Exact line anchors
+        for q, line in lines:
+            diagonals = []
+            p = str1.find(line)
+            while p >= 0:
+                diagonals.append(p - q)
+                p = str1.find(line, p + 1)
+            if diagonals:
+                self._record('exact')
+                if expected is None:
+                    return diagonals[-1]
+                return min(diagonals, key=lambda d: abs(d - expected))
+
+        # Fuzzy line anchors, near the expected diagonal when there is one
+        for q, line in lines:
+            start = 0
+            if expected is not None:
+                start = max(0, int(expected) + q - len(line))
+            matcher = ApproximateMatcher(line, max(1, int(self.max_error*len(line))))
+            end = matcher.search(str1[start:], matcher.max_errors)
+            if end >= 0:
+                end += start
+            elif start > 0:
+                end = matcher.search(str1, matcher.max_errors)
+            if end >= 0:
+                self._record('fuzzy')
+                return end - len(line) - q
+
+        self._record('miss')
+        return None
+
+    def fallback(self):
+        """The band alignment was rejected, the full alignment runs instead"""
+        self._record('fallback')
+
+class Seam(NamedTuple):
+    """Where a merge joined: the first `repeated` characters of the new text overlapped, `identity` of them matched"""
+    repeated: int
+    identity: float
+
 class OCRMerger:
-    def __init__(self, custom_vocab=None, ocr_corrections=DEFAULT_CORRECTIONS, language='nl'):
+    def __init__(self, custom_vocab=None, ocr_corrections=DEFAULT_CORRECTIONS, language='nl', anchor_k=None, anchor_band=64, aligner_cache=8, overlap=None, strategy='characters', spell_engine='pyspellchecker', spell_cache=65536, arbitration_cache=16384, confidence=None, confidence_cache=16384):
+        # Bounded caches for spell check results and arbitrated candidate tuples,
+        # the seam is merged again on every page so the same words keep coming back
+        self._cache = LRUCache(maxsize=spell_cache)
+        self._arbitration = LRUCache(maxsize=arbitration_cache)
+
         # Initialize spell checker with optional custom vocabulary
-        self.spell = SpellChecker(language=language)
-        if custom_vocab:
-            self.spell.word_frequency.load_words(custom_vocab)
+        self.language = language
+        self.custom_vocab = custom_vocab
+        self.use_spell_engine(spell_engine)
 
-        # Common OCR misread characters mapping
+        # Common OCR misread characters mapping, applied as a translation table
+        # on the lowercased word
         self.ocr_corrections = ocr_corrections
+        self.ocr_table = None
+        if ocr_corrections is not None:
+            self.ocr_table = str.maketrans({k.lower(): v.lower() for k, v in ocr_corrections.items()})
 
-        # Cache for spell check results
-        self._cache = {}
+        # Words tesseract read with at least this confidence (0-100) skip the
+        # spell engine, None ignores confidences
+        self.confidence = confidence
+        self._confidences = LRUCache(maxsize=confidence_cache)
+
+        # Configured aligners, keyed by their scores
+        self._aligners = LRUCache(maxsize=aligner_cache)
+
+        # Seed length and band width for anchored alignment, None aligns the whole window
+        self.anchor_k = anchor_k
+        self.anchor_band = anchor_band
+
+        # Optional OverlapDetector for the banded fast path
+        self.overlap = overlap
+
+        # 'characters' merges with align_sequences, 'words' with merge_words
+        self.strategy = strategy
+
+        # Seam of the last merge, None when it found no overlap
+        self.seam = None
+
+    def use_spell_engine(self, spell_engine='pyspellchecker'):
+        """Switch between pyspellchecker and the precomputed SymSpell index"""
+        if spell_engine == 'symspell':
+            # Memory-mapped index behind the same correction/`in` interface
+            self.spell = SymSpellIndex.for_language(self.language, self.custom_vocab)
+        else:
+            from spellchecker import SpellChecker
+            self.spell = SpellChecker(language=self.language)
+            if self.custom_vocab:
+                self.spell.word_frequency.load_words(self.custom_vocab)
+        self._cache.clear()
+        self._arbitration.clear()
 
     def correct_ocr_errors(self, word:str):
         # Detect capitalization pattern
@@ -42,14 +211,8 @@ class OCRMerger:
         else:
             cap_type = 'lower'
 
-        # Convert to lowercase for uniform correction
-        word_lower = word.lower()
-
-        # Apply OCR character corrections on lowercase word
-        corrected_chars = []
-        for ch in word_lower:
-            corrected_chars.append(self.ocr_corrections.get(ch, ch))
-        corrected_word = ''.join(corrected_chars).lower()
+        # Apply OCR character corrections on the lowercase word
+        corrected_word = word.lower().translate(self.ocr_table)
 
         # Restore original capitalization pattern
         if cap_type == 'upper':
@@ -61,16 +224,54 @@ class OCRMerger:
 
     def is_word_correct(self, word:str):
         # Check cache first
-        if word in self._cache:
-            return self._cache[word]
+        correct = self._cache.get(word)
+        if correct is not None:
+            tracker.count('Spelling cache: hit')
+            return correct
+        tracker.count('Spelling cache: miss')
         # Check if word is known or can be corrected by spellchecker
         correct = word in self.spell or word.lower() in self.spell # 2 lookups? Does casing really matter for this dictionary lookup?
         self._cache[word] = correct
         return correct
 
+    def observe(self, text):
+        """
+        Remember the word confidences of a page read as `ocr.OCRText`.
+        They replace what earlier pages said about the same words, so a later
+        misread never inherits an earlier confident reading. A word read more
+        than once on the page keeps its lowest confidence.
+        """
+        words = getattr(text, 'words', ())
+        if self.confidence is None or not words:
+            return
+        page = {}
+        for word in words:
+            page[word.text] = min(page.get(word.text, word.confidence), word.confidence)
+        for word, confidence in page.items():
+            self._confidences[word] = confidence
+        confident = sum(word.confidence >= self.confidence for word in words)
+        tracker.count('Words: high confidence', confident)
+        tracker.count('Words: low confidence', len(words) - confident)
+
+    def word_confidence(self, word:str):
+        """Confidence tesseract gave `word` on the latest page that read it, -1 if unknown"""
+        if self.confidence is None:
+            return -1.
+        return self._confidences.get(word, -1.)
+
+    def is_confident(self, word:str):
+        return self.confidence is not None and self.word_confidence(word) >= self.confidence
+
     def choose_better_word(self, w1:str, w2:str):
+        # Trust tesseract where it is confident, only doubtful words go to the spell engine
+        c1 = self.word_confidence(w1)
+        c2 = self.word_confidence(w2)
+        if self.confidence is not None and max(c1, c2) >= self.confidence:
+            tracker.count('Arbitration: by confidence')
+            return w1 if c1 >= c2 else w2
+
         # Pre-correct OCR errors
-        if self.ocr_corrections is not None:
+        if self.ocr_table is not None:
             w1 = self.correct_ocr_errors(w1)
             w2 = self.correct_ocr_errors(w2)
 
@@ -83,7 +284,7 @@ class OCRMerger:
         elif w2_correct and not w1_correct:
             return w2
         elif w1_correct and w2_correct:
-            # Both correct, choose the one closer to original (or arbitrarily w1)
+            # Both correct, choose w1, confidences break the tie in `prefer_confident`
             return w1
         else:
             # Neither correct, try to get best candidate from spell checker
@@ -115,23 +316,78 @@ class OCRMerger:
     def choose_best_word_among(self, *words:str):
         """
         Given a list of words (strings), pick the best one using pairwise comparisons.
+        Results are cached by candidate tuple.
         """
-        # Filter unique entries
-        words = list(set(words))
-
         # If all words are identical, just return one
-        if len(words) == 1:
-            return words[0]
+        first = words[0]
+        if all(w == first for w in words):
+            return first
+
+        # Unique entries, in order so the result does not depend on hashing
+        key = tuple(dict.fromkeys(words))
+
+        # Confidences change from page to page, and deciding by them is cheap anyway
+        if any(self.is_confident(w) for w in key):
+            best_word = key[0]
+            for w in key[1:]:
+                best_word = self.choose_better_word(best_word, w)
+            return self.prefer_confident(best_word, key)
+
+        # The cached decision only depends on the spell engine
+        best_word = self._arbitration.get(key)
+        if best_word is not None:
+            tracker.count('Arbitration cache: hit')
+        else:
+            tracker.count('Arbitration cache: miss')
+
+            # Iteratively pick best word by pairwise comparison
+            best_word = key[0]
+            for w in key[1:]:
+                best_word = self.choose_better_word(best_word, w)
+            self._arbitration[key] = best_word
+        return self.prefer_confident(best_word, key)
 
-        # Iteratively pick best word by pairwise comparison
-        best_word = words[0]
-        for w in words[1:]:
-            best_word = self.choose_better_word(best_word, w)
+    def prefer_confident(self, best_word:str, words):
+        """
+        Between dictionary words, the reading tesseract was most confident of wins.
+        Applied after the arbitration cache, the same candidates can come with
+        other confidences on the next page.
+        """
+        if self.confidence is None or not self.is_word_correct(best_word):
+            return best_word
+
+        # Confidence of every reading, after the same OCR corrections arbitration applies
+        readings = {}
+        for w in words:
+            corrected = self.correct_ocr_errors(w) if self.ocr_table is not None else w
+            readings[corrected] = max(readings.get(corrected, -1.), self.word_confidence(w))
+
+        confidence = readings.get(best_word, -1.)
+        for w, c in readings.items():
+            if c > confidence and self.is_word_correct(w):
+                best_word, confidence = w, c
         return best_word
 
+    def choose_best_words(self, alternatives:list[tuple[str]]):
+        """
+        Pick the words for one lattice slot.
+        Readings with the same word count are arbitrated word by word,
+        otherwise the reading with the most known words wins.
+        """
+        if len(alternatives) == 1:
+            return list(alternatives[0])
+
+        first, second = alternatives
+        if len(first) == len(second):
+            return self.merge_aligned_words(first, second)
+
+        known_first = sum(self.is_confident(w) or self.is_word_correct(w) for w in first)
+        known_second = sum(self.is_confident(w) or self.is_word_correct(w) for w in second)
+        return list(second if known_second > known_first else first)
+
     def merge_aligned_words(self, *word_lists:list[str]):
         """
-        Merge any number of aligned word sequences.
+        Merge any number of aligned word sequences, one column of candidates at a time.
         All sequences must have the same length.
         """
         if not word_lists:
@@ -142,33 +398,179 @@ class OCRMerger:
             if len(wl) != length:
                 raise ValueError("All aligned sequences must have the same length")
 
-        merged_words = []
-        for i in range(length):
-            candidates = [wl[i] for wl in word_lists]
-            # If all candidates are identical, no need to choose
-            if len(set(candidates)) == 1:
-                merged_words.append(candidates[0])
-            else:
-                best_word = self.choose_best_word_among(*candidates)
-                merged_words.append(best_word)
+        return [self.choose_best_word_among(*column) for column in zip(*word_lists)]
+
+    def merge(self, str1:str, str2:str, expected_overlap=None, head=None, **scores):
+        """
+        Merge str2 onto the end of str1 with the configured strategy.
+        `head` and `scores` are passed on to `align_sequences` for the 'characters' strategy.
+        Where the pages were joined is left in `self.seam`.
+        """
+        self.seam = None
+        if self.strategy == 'words':
+            return self.merge_words(str1, str2)
+        return self.align_sequences(str1, str2, expected_overlap=expected_overlap, head=head, **scores)
 
-        return merged_words
+    def merge_words(self, str1:str, str2:str, gap_penalty=1, max_error=0.1):
+        """
+        Merge on whole words: find the overlap with `overlap_alignment_nw`
+        and arbitrate the aligned word pairs.
+        """
+        words1 = split_keep_newlines(str1)
+        words2 = split_keep_newlines(str2)
+
+        tracker.start('merge_words: Overlap')
+        overlap, score, pairs = overlap_alignment_nw(words1, words2, gap_penalty, max_error)
+        tracker.stop('merge_words: Overlap')
+
+        if overlap == 0:
+            # No overlap found, append
+            return join_with_newlines(words1 + words2)
+
+        equal = sum(i1 >= 0 and i2 >= 0 and words1[i1] == words2[i2] for i1, i2 in pairs)
+        self.seam = Seam(len(join_with_newlines(words2[:overlap])), equal / len(pairs))
+
+        tracker.start('merge_words: Merge')
+
+        # Non-overlapping prefix
+        start = next((i1 for i1, _ in pairs if i1 >= 0), len(words1))
+        merged = words1[:start]
+
+        for i1, i2 in pairs:
+            if i1 < 0:
+                merged.append(words2[i2])
+            elif i2 < 0:
+                merged.append(words1[i1])
+            elif words1[i1] == words2[i2]:
+                merged.append(words1[i1])
+            elif '\n' in (words1[i1], words2[i2]):
+                # Do not arbitrate line breaks against words
+                merged.extend((words1[i1], words2[i2]))
+            else:
+                merged.append(self.choose_best_word_among(words1[i1], words2[i2]))
+
+        # Non-overlapping suffix
+        merged.extend(words2[overlap:])
+
+        tracker.stop('merge_words: Merge')
+
+        return join_with_newlines(merged)
+
+    def get_aligner(self, mode='global', match_score=2, mismatch_score=-1, open_gap_score=-.5, extend_gap_score=-.1):
+        """Reuse a configured PairwiseAligner for this set of scores"""
+        key = (mode, match_score, mismatch_score, open_gap_score, extend_gap_score)
+        Aligner = self._aligners.get(key)
+        if Aligner is None:
+            from Bio import Align
+            Aligner = Align.PairwiseAligner(mode=mode, match_score=match_score, mismatch_score=mismatch_score)
+            Aligner.open_gap_score = open_gap_score
+            Aligner.extend_gap_score = extend_gap_score
+            Aligner.target_end_gap_score = 0.0
+            Aligner.query_end_gap_score = 0.0
+            self._aligners[key] = Aligner
+        return Aligner
+
+    def align_sequences(self, str1:str, str2:str, mode='global', match_score=2, mismatch_score=-1, open_gap_score=-.5, extend_gap_score=-.1, max_alignments=1, expected_overlap=None, head=None):
+        """
+        Merge str2 onto the end of str1.
+        `expected_overlap` is the fraction of str2 expected to repeat the end of
+        str1, used by the overlap fast path to pick among anchors. When only the
+        first `head` characters of str2 can repeat str1, the full alignment is
+        limited to those and the rest of str2 is appended as read.
+        """
 
-    def align_sequences(self, str1:str, str2:str, mode='global', match_score=2, mismatch_score=-1, open_gap_score=-.5, extend_gap_score=-.1, max_alignments=1):
+        # Fast path: align only around the seam found by the overlap detector
+        if self.overlap is not None:
+            tracker.start('align_sequences: Overlap')
+            words = self.banded_words(str1, str2, expected_overlap, match_score, mismatch_score, open_gap_score)
+            tracker.stop('align_sequences: Overlap')
+            if words is not None:
+                return join_with_newlines(words)
 
         tracker.start('align_sequences: Prep')
 
-        Aligner = Align.PairwiseAligner(mode=mode, match_score=match_score, mismatch_score=mismatch_score)
-        Aligner.open_gap_score = open_gap_score
-        Aligner.extend_gap_score = extend_gap_score
-        Aligner.target_end_gap_score = 0.0
-        Aligner.query_end_gap_score = 0.0
+        Aligner = self.get_aligner(mode, match_score, mismatch_score, open_gap_score, extend_gap_score)
+
+        # Narrow the window down to the band around a shared seed
+        cut1, cut2 = 0, len(str2)
+        if self.anchor_k:
+            anchor = find_anchor(str1, str2, self.anchor_k)
+            if anchor is not None:
+                cut1, cut2 = anchor_band(str1, str2, *anchor, self.anchor_band)
+            if cut1 >= len(str1) or cut2 == 0:
+                cut1, cut2 = 0, len(str2)
+
+        # With free end gaps a short str1 aligns anywhere in a long str2, keep it to the head
+        if head is not None and head < cut2:
+            ends = [i for i in (str2.find(' ', head), str2.find('\n', head)) if i >= 0]
+            cut2 = min(ends) if ends else len(str2)
+
+        tracker.stop('align_sequences: Prep')
+
+        words = split_keep_newlines(str1[:cut1])
+        words.extend(self.align_words(Aligner, str1[cut1:], str2[:cut2], max_alignments))
+        words.extend(split_keep_newlines(str2[cut2:]))
+
+        return join_with_newlines(words)
+
+    def banded_words(self, str1:str, str2:str, expected_overlap=None, match_score=2, mismatch_score=-1, gap_score=-.5):
+        """Merge along the diagonal found by `self.overlap`, None when the fast path misses"""
+        expected = None
+        if expected_overlap is not None:
+            expected = len(str1) - expected_overlap*len(str2)
+
+        diagonal = self.overlap.detect(str1, str2, expected)
+        if diagonal is None:
+            return None
+
+        aligned = banded_alignment(str1, str2, diagonal, self.overlap.band, match_score, mismatch_score, gap_score)
+        if aligned is None or aligned[-1] < self.overlap.min_identity:
+            self.overlap.fallback()
+            return None
+
+        indices1, indices2, start1, fin2, identity = aligned
+        return self.merge_columns(str1, str2, indices1, indices2, start1, fin2)
+
+    def merge_columns(self, str1:str, str2:str, indices1, indices2, start1:int, fin2:int):
+        """Words of an alignment: str1's prefix, the arbitrated overlap and str2's residue"""
+
+        # Non-overlapping prefix
+        words = split_keep_newlines(str1[:start1])
+
+        # Non-overlapping suffix
+        residue = split_keep_newlines(str2[fin2:])
+
+        # How much of str2 was already there, and how well it matched
+        matched = sum(i1 >= 0 and 0 <= i2 < fin2 and str1[i1] == str2[i2] for i1, i2 in zip(indices1, indices2))
+        self.seam = Seam(fin2, matched / fin2 if fin2 else 0.)
+
+        tracker.start('align_sequences: Construct amalgamations')
+
+        # Per-word candidates from both readings of the aligned region
+        lattice = word_lattice(str1, str2, indices1, indices2, start1, fin2)
+
+        tracker.stop('align_sequences: Construct amalgamations')
+        tracker.start('align_sequences: Merge amalgamations')
+
+        # Choose best set of words
+        for alternatives in lattice:
+            words.extend(self.choose_best_words(alternatives))
+        words.extend(residue)
+
+        tracker.stop('align_sequences: Merge amalgamations')
+
+        return words
+
+    def align_words(self, Aligner, str1:str, str2:str, max_alignments=1):
+        """Align two strings with `Aligner` and merge them into a list of words"""
+
+        tracker.start('align_sequences: Align')
 
         alignments = Aligner.align(str1, str2)
 
         variants = []
 
-        tracker.stop('align_sequences: Prep')
+        tracker.stop('align_sequences: Align')
 
         for alignment in alignments:
 
@@ -176,54 +578,19 @@ class OCRMerger:
 
             indices1, indices2 = alignment.indices
             blocks1, blocks2 = alignment.aligned
-
-            # Non-overlapping prefix
             start1 = blocks1[0, 0]
-            words = split_keep_newlines(str1[:start1])
-
-            # Non-overlapping suffix
             fin2 = blocks2[-1, -1]
-            residue = split_keep_newlines(str2[fin2:])
-
-            # Build set of possible amalgamations
-            amalgamations = [""] # Start with a single branch
 
             tracker.stop('align_sequences: Alignment prep')
-            tracker.start('align_sequences: Construct amalgamations')
-
-            for i1, i2 in zip(indices1, indices2):
-                if i1<start1 or i2>fin2:
-                    continue # Only take aligned regions
-                for a, amalg in enumerate(amalgamations.copy()):
-                    if i1>=0:
-                        if i2>=0:
-                            if str1[i1] != str2[i2]:
-                                amalgamations.append(amalg + str2[i2]) # 2 options, add branch
-                        amalgamations[a] = amalg + str1[i1]
-                    elif i2>=0:
-                        amalgamations[a] = amalg + str2[i2]
-
-            tracker.stop('align_sequences: Construct amalgamations')
-            tracker.start('align_sequences: Merge amalgamations')
 
-            # Choose best set of words
-            amalgamations = [split_keep_newlines(a) for a in amalgamations]
-            prime_amalgamation = [self.choose_best_word_among(*w) for w in zip(*amalgamations)]
-
-            words.extend(prime_amalgamation)
-            words.extend(residue)
-            variants.append(words)
-
-            tracker.stop('align_sequences: Merge amalgamations')
+            variants.append(self.merge_columns(str1, str2, indices1.tolist(), indices2.tolist(), start1, fin2))
 
             if len(variants) >= max_alignments:
                 break
 
-        assert all(len(v) == len(variants[0]) for v in variants), "Variants must all have equal word count"
-
         tracker.start('align_sequences: Merge variants')
 
-        prime_amalgamation = join_with_newlines([self.choose_best_word_among(*w) for w in zip(*variants)])
+        prime_amalgamation = self.merge_aligned_words(*variants)
 
         tracker.stop('align_sequences: Merge variants')
 
@@ -248,22 +615,146 @@ def join_with_newlines(words: list[str]) -> str:
             result.append(' ' + curr)
     return ''.join(result)
 
-def fuzzy_contains(body, target, max_error=1):
+def find_anchor(str1:str, str2:str, k:int):
+    """
+    Find an exact k-mer seed shared by the end of str1 and the start of str2.
+    Returns (p, q) with str1[p:p+k] == str2[q:q+k], taking the earliest seed in
+    str2 and its last occurrence in str1, or None when there is no seed.
+    """
+    last = {}
+    for p in range(len(str1)-k+1):
+        last[str1[p:p+k]] = p
+
+    for q in range(len(str2)-k+1):
+        kmer = str2[q:q+k]
+        if kmer.isspace():
+            continue
+        p = last.get(kmer)
+        if p is not None:
+            return p, q
+    return None
+
+def anchor_band(str1:str, str2:str, p:int, q:int, band:int):
+    """
+    Cut points (cut1, cut2) so that str1[cut1:] and str2[:cut2] cover the
+    overlap implied by the seed at (p, q), widened by `band` characters and
+    snapped to word boundaries.
+    """
+    diagonal = p - q
+    cut1 = max(0, diagonal - band)
+    cut2 = min(len(str2), len(str1) - diagonal + band)
+
+    # Do not split words
+    cut1 = max(str1.rfind(' ', 0, cut1), str1.rfind('\n', 0, cut1)) + 1
+    ends = [i for i in (str2.find(' ', cut2), str2.find('\n', cut2)) if i >= 0]
+    cut2 = min(ends) if ends else len(str2)
+
+    return cut1, cut2
+
+def banded_alignment(str1:str, str2:str, diagonal:int, band:int, match_score=2, mismatch_score=-1, gap_score=-.5):
     """
-    Returns True if str2 is found within str1 allowing up to max_error
-    (insertions, deletions, substitutions) in the match, else False.
+    Overlap alignment of the end of str1 against the start of str2, restricted to
+    cells with |i - j - diagonal| <= band and with free end gaps.
+    Returns (indices1, indices2, start1, fin2, identity) with the columns laid out
+    like Bio's `alignment.indices` (-1 for gaps), or None if nothing aligns.
     """
-    # Build a fuzzy regex pattern for str2 allowing up to max_error
-    # (?e) enables fuzzy matching, {e<=max_error} limits errors
+    m, n = len(str1), len(str2)
+    width = 2*band + 1
+    ninf = float('-inf')
+
+    # Row i holds columns j = i - diagonal - band + w, for w in range(width)
+    scores = [[ninf]*width for _ in range(m+1)]
+    moves = [bytearray(width) for _ in range(m+1)] # 0 start, 1 diagonal, 2 gap in str2, 3 gap in str1
+    best, best_i, best_w = ninf, None, None
+    for i in range(m+1):
+        low = i - diagonal - band
+        row = scores[i]
+        prev = scores[i-1] if i else None
+        move = moves[i]
+        for w in range(max(0, -low), min(width, n - low + 1)):
+            j = low + w
+            if i == 0 or j == 0:
+                score = 0. # Free leading end gaps
+            else:
+                score = prev[w] + (match_score if str1[i-1] == str2[j-1] else mismatch_score)
+                move[w] = 1
+                if w+1 < width and prev[w+1] + gap_score > score:
+                    score = prev[w+1] + gap_score
+                    move[w] = 2
+                if w > 0 and row[w-1] + gap_score > score:
+                    score = row[w-1] + gap_score
+                    move[w] = 3
+            row[w] = score
+            if (i == m or j == n) and score > best:
+                best, best_i, best_w = score, i, w
+
+    if best_i is None:
+        return None
+
+    # Trace back to the start of the alignment
+    columns = []
+    i, w = best_i, best_w
+    end_i = best_i
+    while moves[i][w] != 0:
+        j = i - diagonal - band + w
+        if moves[i][w] == 1:
+            columns.append((i-1, j-1))
+            i -= 1
+        elif moves[i][w] == 2:
+            columns.append((i-1, -1))
+            i -= 1
+            w += 1
+        else:
+            columns.append((-1, j-1))
+            w -= 1
+    columns.reverse()
 
-    body = ' '.join(body)
-    target = ' '.join(target)
+    # str1 continues past the end of str2
+    columns.extend((i1, -1) for i1 in range(end_i, m))
 
-    pattern = f'(?e){regex.escape(target)}{{e<={max_error}}}'
+    aligned = [(i1, i2) for i1, i2 in columns if i1 >= 0 and i2 >= 0]
+    if not aligned:
+        return None
+    identity = sum(str1[i1] == str2[i2] for i1, i2 in aligned) / len(aligned)
 
-    # Search for fuzzy match anywhere in str1
-    match = regex.search(pattern, body)
-    return match is not None
+    indices1 = [i1 for i1, _ in columns]
+    indices2 = [i2 for _, i2 in columns]
+    return indices1, indices2, aligned[0][0], aligned[-1][1] + 1, identity
+
+def word_lattice(str1:str, str2:str, indices1, indices2, start1:int, fin2:int) -> list[tuple[tuple[str]]]:
+    """
+    Collect per-word candidates for the aligned region of two sequences.
+    The first reading takes str1's character in every aligned column, the second
+    takes str2's character where the columns disagree. Slots are cut at whitespace
+    both readings share, so each slot holds one or two distinct word tuples and
+    the cost is linear in the alignment length.
+    """
+    slots = []
+    reading1, reading2 = [], []
+
+    def close_slot():
+        words1 = tuple(split_keep_newlines(''.join(reading1)))
+        words2 = tuple(split_keep_newlines(''.join(reading2)))
+        if words1 or words2:
+            slots.append((words1,) if words1 == words2 else (words1, words2))
+        reading1.clear()
+        reading2.clear()
+
+    for i1, i2 in zip(indices1, indices2):
+        if i1<start1 or i2>fin2:
+            continue # Only take aligned regions
+        c1 = str1[i1]
+        c2 = str2[i2] if i2>=0 else c1
+        if c1 == c2 and c1.isspace():
+            close_slot()
+            if c1 == '\n':
+                slots.append((('\n',),))
+        else:
+            reading1.append(c1)
+            reading2.append(c2)
+    close_slot()
+
+    return slots
 
 def word_distance(w1:str, w2:str):
     # Normalized Levenshtein distance between two words
@@ -272,49 +763,96 @@ def word_distance(w1:str, w2:str):
         return 0
     return Levenshtein.distance(w1, w2) / max_len
 
+def word_distance_matrix(words1:list[str], words2:list[str]):
+    """Normalized Levenshtein distance between every pair of words, as an (m, n) array"""
+    if not words1 or not words2:
+        return np.zeros((len(words1), len(words2)))
+    if cdist is not None:
+        return cdist(words1, words2, scorer=RapidLevenshtein.normalized_distance, dtype=np.float64, workers=-1)
+
+    # Compute each distinct pair once
+    unique1, inverse1 = np.unique(np.array(words1, dtype=object), return_inverse=True)
+    unique2, inverse2 = np.unique(np.array(words2, dtype=object), return_inverse=True)
+    distances = np.empty((len(unique1), len(unique2)))
+    for i, w1 in enumerate(unique1):
+        for j, w2 in enumerate(unique2):
+            distances[i, j] = word_distance(w1, w2)
+    return distances[np.ix_(inverse1, inverse2)]
+
+def _gap_row(previous, distances, gap_penalty, steps, first):
+    """One DP row: substitutions and deletions elementwise, insertions by a running minimum"""
+    best = np.minimum(previous[:-1] + distances, previous[1:] + gap_penalty)
+    row = np.concatenate(([first], best))
+    return np.minimum.accumulate(row - steps) + steps
+
 def needleman_wunsch(seq1, seq2, gap_penalty):
     m, n = len(seq1), len(seq2)
-    dp = [[0] * (n + 1) for _ in range(m + 1)]
+    distances = word_distance_matrix(list(seq1), list(seq2))
+    steps = np.arange(n + 1) * gap_penalty
 
-    # Initialize dp matrix
+    # First row is all insertions
+    row = steps.astype(float)
     for i in range(1, m + 1):
-        dp[i][0] = i * gap_penalty
-    for j in range(1, n + 1):
-        dp[0][j] = j * gap_penalty
+        row = _gap_row(row, distances[i - 1], gap_penalty, steps, i * gap_penalty)
 
-    # Fill dp matrix
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            cost_sub = dp[i - 1][j - 1] + word_distance(seq1[i - 1], seq2[j - 1])
-            cost_del = dp[i - 1][j] + gap_penalty
-            cost_ins = dp[i][j - 1] + gap_penalty
-            dp[i][j] = min(cost_sub, cost_del, cost_ins)
+    return row[n]
 
-    return dp[m][n]
+def overlap_costs(distances, gap_penalty):
+    """
+    Fill the word-level DP once for every suffix/prefix overlap.
+    The alignment may start anywhere in words1 for free, so cost[i, j] is the
+    cheapest alignment of a suffix of words1[:i] against words2[:j] and the
+    last row holds the cost of every overlap of words1's end with words2[:j].
+    """
+    m, n = distances.shape
+    steps = np.arange(n + 1) * gap_penalty
+    cost = np.empty((m + 1, n + 1))
+    cost[0] = steps
+    for i in range(1, m + 1):
+        cost[i] = _gap_row(cost[i - 1], distances[i - 1], gap_penalty, steps, 0.)
+    return cost
+
+def overlap_traceback(cost, distances, gap_penalty, j):
+    """Aligned word pairs (i1, i2) of the overlap ending at (m, j), -1 for gaps"""
+    i = cost.shape[0] - 1
+    path = []
+    while j > 0:
+        if i > 0 and np.isclose(cost[i, j], cost[i - 1, j - 1] + distances[i - 1, j - 1]):
+            path.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif i > 0 and np.isclose(cost[i, j], cost[i - 1, j] + gap_penalty):
+            path.append((i - 1, -1))
+            i -= 1
+        else:
+            path.append((-1, j - 1))
+            j -= 1
+    path.reverse()
+    return path
 
 def align_sequences_nw(words1, words2, gap_penalty=1, max_error=0.1):
-    m, n = len(words1), len(words2)
-
-    best_score = float('inf')
-    best_overlap = 0
-
-    for overlap_len in range(1, min(m, n) + 1):
-        suffix = words1[m - overlap_len:]
-        prefix = words2[:overlap_len]
-
-        # NW expects sequences as strings or lists
-        # Compute alignment distance with gap penalty
-        dist = needleman_wunsch(suffix, prefix, gap_penalty)
-
-        # Normalize distance by overlap length
-        norm_dist = dist / overlap_len
-
-        if norm_dist < best_score:
-            best_score = norm_dist
-            best_overlap = overlap_len
+    """
+    Best overlap of the end of words1 with the start of words2.
+    Returns (overlap length in words2, normalized distance), or (0, None).
+    """
+    overlap, score, _ = overlap_alignment_nw(words1, words2, gap_penalty, max_error)
+    return overlap, score
+
+def overlap_alignment_nw(words1, words2, gap_penalty=1, max_error=0.1):
+    """Like `align_sequences_nw`, also returning the aligned word pairs of the overlap"""
+    distances = word_distance_matrix(list(words1), list(words2))
+    cost = overlap_costs(distances, gap_penalty)
+    n = len(words2)
+    if n == 0 or len(words1) == 0:
+        return 0, None, []
+
+    # Normalize distance by overlap length, the longest overlap wins ties
+    scores = cost[-1, 1:] / np.arange(1, n + 1)
+    best_overlap = n - int(np.argmin(scores[::-1]))
+    best_score = float(scores[best_overlap - 1])
 
     if best_score > max_error:
         # No good overlap found, treat as no overlap
-        return 0, None
+        return 0, None, []
 
-    return best_overlap, best_score
+    pairs = overlap_traceback(cost, distances, gap_penalty, best_overlap)
+    return best_overlap, best_score, pairs
@@ -0,0 +1,178 @@
+"""Cheap image signatures for comparing consecutive screen grabs."""
+import numpy as np
+
+from timer import tracker
+
+def signature(image, size=(64, 64)):
+    """Downsampled grayscale copy of a PIL image, as floats in [0, 1]"""
+    small = image.resize(size).convert('L')
+    return np.asarray(small, dtype=np.float32) / 255
+
+class FrameChangeDetector():
+    """
+    Tell whether a grab differs from the last frame that was sent to OCR.
+    Frames whose mean absolute difference to it stays below `threshold` are
+    counted as skipped. After `stall` skipped frames in a row scrolling has
+    stopped moving the page, which is a strong hint the end has been reached.
+    """
+    def __init__(self, threshold=.002, stall=3, size=(64, 64)):
+        self.threshold = threshold
+        self.stall = stall
+        self.size = size
+        self.previous = None
+        self.unchanged = 0
+
+    def delta(self, image):
+        """Mean absolute difference to the last accepted frame, 1 if there is none"""
+        current = signature(image, self.size)
+        if self.previous is None:
+            return 1., current
+        return float(np.mean(np.abs(current - self.previous))), current
+
+    def changed(self, image):
+        tracker.start('Frame signature')
+        delta, current = self.delta(image)
+        tracker.stop('Frame signature')
+
+        if delta > self.threshold:
+            # Compare later frames against this one, so slow drift still adds up
+            self.previous = current
+            self.unchanged = 0
+            tracker.count('Frames: changed')
+            return True
+
+        self.unchanged += 1
+        tracker.count('Frames: skipped')
+        return False
+
+    @property
+    def stalled(self):
+        """True once `stall` frames in a row were unchanged, never if `stall` is 0"""
+        return bool(self.stall) and self.unchanged >= self.stall
+
+def row_signature(image, bands=8):
+    """Mean intensity per pixel row in `bands` vertical strips, centred per strip"""
+    gray = np.asarray(image.convert('L'), dtype=np.float32)
+    height, width = gray.shape
+    bands = max(1, min(bands, width))
+    usable = width - width % bands
+    rows = gray[:, :usable].reshape(height, bands, -1).mean(axis=2)
+    return rows - rows.mean(axis=0)
+
+def estimate_shift(previous, current, expected=None, min_overlap=32, tolerance=.02):
+    """
+    Vertical scroll distance between two row signatures by normalized cross-correlation.
+    Returns (shift, confidence): content moved up by `shift` rows and the Pearson
+    correlation of the overlapping rows. Text lines repeat, so shifts scoring
+    within `tolerance` of the best are tie-broken towards the `expected` shift.
+    """
+    height = min(len(previous), len(current))
+    shifts, scores = [], []
+    for shift in range(0, height - min_overlap + 1):
+        a = previous[shift:height].ravel()
+        b = current[:height-shift].ravel()
+        a = a - a.mean()
+        b = b - b.mean()
+        norm = np.sqrt((a*a).sum() * (b*b).sum())
+        if norm == 0:
+            continue
+        shifts.append(shift)
+        scores.append(float((a*b).sum() / norm))
+
+    if not shifts:
+        return None, 0.
+
+    best = max(scores)
+    candidates = [s for s, score in zip(shifts, scores) if score >= best - tolerance]
+    if expected is None:
+        shift = candidates[0]
+    else:
+        shift = min(candidates, key=lambda s: abs(s - expected))
+    return shift, scores[shifts.index(shift)]
+
+def ink_profile(gray, ink=48, min_height=1):
+    """
+    Rows of a grayscale array holding ink, anything far from the most common
+    (background) value. Runs of ink lower than `min_height` rows are left out,
+    on a noisy grab they are specks rather than text.
+    """
+    background = np.bincount(gray[:, ::4].ravel(), minlength=256).argmax()
+    profile = (np.abs(gray.astype(np.int16) - int(background)) > ink).any(axis=1)
+    if min_height > 1:
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], profile.astype(np.int8), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            if end - start < min_height:
+                profile[start:end] = False
+    return profile
+
+def blank_gaps(profile):
+    """Gaps between text lines as [start, end) runs of blank rows in an ink profile"""
+    edges = np.flatnonzero(np.diff(profile.astype(np.int8)))
+    starts = edges[~profile[edges+1]] + 1
+    ends = edges[profile[edges+1]] + 1
+    if len(ends) and len(starts) and ends[0] < starts[0]:
+        ends = ends[1:]
+    return [(int(start), int(end)) for start, end in zip(starts, ends)]
+
+class ScrollRegistration():
+    """
+    Crop each frame down to the rows scrolled into view since the previous one,
+    plus a margin of already seen text for the alignment: `lines` text lines at
+    the line pitch measured on the frame, or `overlap` rows if that is more.
+    The strip starts in the blank gap above the margin, so OCR never gets a
+    text line cut through. Frames whose shift cannot be estimated with at least
+    `min_confidence` are passed whole.
+    """
+    def __init__(self, min_confidence=.8, overlap=30, lines=3, bands=8):
+        self.min_confidence = min_confidence
+        self.overlap = overlap
+        self.lines = lines
+        self.bands = bands
+        self.previous = None
+
+        # Last trusted shift in rows and the number of text lines at the top of
+        # the strip that were on screen before, None if the last frame was passed whole
+        self.shift = None
+        self.lines_seen = None
+
+    def cut(self, image, seen):
+        """
+        First row of the strip for a frame whose first `seen` rows were on
+        screen before, and the text lines starting above `seen` in the strip
+        """
+        profile = ink_profile(np.asarray(image.convert('L')), min_height=3)
+        gaps = blank_gaps(profile)
+        middles = [(start + end) // 2 for start, end in gaps]
+        margin = self.overlap
+        if len(middles) > 1:
+            margin = max(margin, self.lines*float(np.median(np.diff(middles))))
+        above = [middle for middle in middles if middle <= seen - margin]
+        top = above[-1] if above else 0
+
+        # Lines start where a gap ends, or right at the top of the frame
+        lines = int(profile[top]) + sum(top < end < seen for start, end in gaps)
+        return top, lines
+
+    def strip(self, image, expected=None):
+        tracker.start('Registration')
+        current = row_signature(image, self.bands)
+        previous, self.previous = self.previous, current
+
+        shift, confidence = None, 0.
+        if previous is not None and previous.shape == current.shape:
+            shift, confidence = estimate_shift(previous, current, expected)
+        trusted = shift is not None and shift > 0 and confidence >= self.min_confidence
+        if trusted:
+            width, height = image.size
+            top, lines = self.cut(image, height - shift)
+        tracker.stop('Registration')
+
+        if not trusted:
+            tracker.count('Registration: full frame')
+            self.shift = self.lines_seen = None
+            return image
+        self.shift = shift
+        self.lines_seen = lines
+
+        tracker.count('Registration: strip')
+        return image.crop((0, top, width, height))
@@ -0,0 +1,80 @@
+"""Approximate string search with a bit-parallel matcher."""
+
+class ApproximateMatcher():
+    """
+    Find `pattern` in a text with at most `max_errors` insertions, deletions
+    and substitutions, using Myers' bit-vector algorithm in Hyyrö's formulation.
+    One column of the edit distance matrix is kept as two bit vectors and
+    updated with a handful of integer operations per text character, so a
+    search is linear in the text length. Python integers are arbitrary
+    precision, patterns longer than a machine word are simply processed in
+    multi-word blocks by the integer arithmetic.
+    The matcher keeps its state between `feed` calls, so a stream of text can
+    be scanned piece by piece.
+    """
+    def __init__(self, pattern:str, max_errors:int):
+        self.pattern = pattern
+        self.max_errors = max_errors
+        self.length = len(pattern)
+        self.mask = (1 << self.length) - 1
+        self.high = 1 << (self.length - 1) if pattern else 0
+
+        # Bit mask of the positions of every character in the pattern
+        self.peq = {}
+        for i, c in enumerate(pattern):
+            self.peq[c] = self.peq.get(c, 0) | 1 << i
+
+        self.reset()
+
+    def reset(self):
+        """Forget the text seen so far"""
+        self.pv = self.mask
+        self.mv = 0
+        self.score = self.length
+
+    def feed(self, text:str, extend:int=0) -> int:
+        """
+        Scan more text, the end offset in `text` of the first match or -1.
+        With `extend` the scan goes on for that many characters past the first
+        match and returns the end of the closest match among them, the first
+        end found can lie up to `max_errors` characters before the best one.
+        """
+        if self.length == 0:
+            return 0 if text else -1
+
+        peq, mask, high, k = self.peq, self.mask, self.high, self.max_errors
+        pv, mv, score = self.pv, self.mv, self.score
+        found = -1
+        best = k + 1
+        last = len(text)
+        for j, c in enumerate(text):
+            eq = peq.get(c, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            if ph & high:
+                score += 1
+            elif mh & high:
+                score -= 1
+            # A match may start anywhere in the text, so no carry into row 0
+            ph = (ph << 1) & mask
+            mh = (mh << 1) & mask
+            pv = (mh | ~(xv | ph)) & mask
+            mv = ph & xv
+            if score < best:
+                if found < 0:
+                    last = min(last, j + 1 + extend)
+                found, best = j + 1, score
+            if j + 1 >= last:
+                break
+
+        self.pv, self.mv, self.score = pv, mv, score
+        return found
+
+    def search(self, text:str, extend:int=0) -> int:
+        """End offset of the first, or with `extend` the closest, match in `text` on its own, or -1"""
+        self.reset()
+        found = self.feed(text, extend)
+        self.reset()
+        return found
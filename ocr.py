@@ -0,0 +1,327 @@
+"""OCR engines that turn screen grabs into text."""
+import io
+import threading
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import numpy as np
+from PIL import Image
+import pytesseract
+
+from frames import ink_profile, blank_gaps
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+def as_image(buffer):
+    """Accept a PIL Image, encoded image bytes or a NumPy array"""
+    if isinstance(buffer, Image.Image):
+        return buffer
+    if isinstance(buffer, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(buffer))
+    if isinstance(buffer, np.ndarray):
+        return Image.fromarray(buffer)
+    raise TypeError(f"Cannot read an image from {type(buffer).__name__}")
+
+class OCRWord(NamedTuple):
+    """One word as tesseract read it"""
+    text: str
+    confidence: float   # 0-100
+    left: int
+    top: int
+    width: int
+    height: int
+    line: int           # line number on the page
+    paragraph: int      # paragraph number on the page
+
+class OCRText(str):
+    """Page text that also carries the words, with confidences, it was built from"""
+    words = ()
+
+    @classmethod
+    def from_words(cls, words):
+        """Lay the words out as tesseract does: lines, with a blank line between paragraphs"""
+        lines = []
+        previous = None
+        for word in words:
+            if previous is None or word.line != previous.line:
+                if previous is not None and word.paragraph != previous.paragraph:
+                    lines.append([])
+                lines.append([])
+            lines[-1].append(word.text)
+            previous = word
+        text = cls('\n'.join(' '.join(line) for line in lines))
+        text.words = tuple(words)
+        return text
+
+def line_bands(image, count, ink=48, paragraph=1.8):
+    """
+    Cut `image` into at most `count` horizontal bands of similar height.
+    Rows without ink are found from the horizontal projection profile and the
+    bands are cut in the middle of those gaps, so no text line is split.
+    Returns (top, bottom, paragraph) per band, where `paragraph` tells whether
+    the gap above the band is `paragraph` times taller than the typical line gap.
+    """
+    gray = np.asarray(as_image(image).convert('L'))
+    height = gray.shape[0]
+    if count <= 1 or height == 0:
+        return [(0, height, False)]
+
+    gaps = blank_gaps(ink_profile(gray, ink))
+    if not gaps:
+        return [(0, height, False)]
+    typical = np.median([end - start for start, end in gaps])
+
+    # Cut through the gap closest to each evenly spaced target row
+    middles = np.array([(start + end) // 2 for start, end in gaps])
+    cuts = sorted({int(np.abs(middles - height*i/count).argmin()) for i in range(1, count)})
+
+    bands = []
+    top, paragraph_above = 0, False
+    for index in cuts:
+        start, end = gaps[index]
+        bands.append((top, int(middles[index]), paragraph_above))
+        top = int(middles[index])
+        paragraph_above = bool(end - start > paragraph*typical)
+    bands.append((top, height, paragraph_above))
+    return bands
+
+def stitch(texts, paragraphs):
+    """Join band texts into one page, with a blank line where a band starts a paragraph"""
+    if any(isinstance(text, OCRText) for text in texts):
+        return stitch_words(texts, paragraphs)
+    page = ""
+    for text, paragraph in zip(texts, paragraphs):
+        text = text.strip()
+        if not text:
+            continue
+        if page:
+            page += '\n\n' if paragraph else '\n'
+        page += text
+    return page
+
+def stitch_words(texts, paragraphs):
+    """`stitch` for bands read with confidences, numbering lines and paragraphs across bands"""
+    words = []
+    for text, paragraph in zip(texts, paragraphs):
+        band = getattr(text, 'words', ())
+        if not band:
+            continue
+        if words:
+            line = words[-1].line + 1
+            first = words[-1].paragraph + 1 if paragraph else words[-1].paragraph
+            band = [w._replace(line=w.line + line, paragraph=w.paragraph + first - band[0].paragraph) for w in band]
+        words.extend(band)
+    return OCRText.from_words(words)
+
+def gather(futures, combine):
+    """A Future resolving to `combine` of the results of `futures` once they are all done"""
+    result = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            result.set_result(combine([future.result() for future in futures]))
+        except Exception as error:
+            result.set_exception(error)
+
+    for future in futures:
+        future.add_done_callback(done)
+    return result
+
+class OCREngine():
+    """
+    Base class for OCR backends.
+    `image_to_string` blocks, `submit` returns a Future and `map` runs a batch
+    on a pool of `workers` threads.
+    With `tiles` > 1 `submit`, `read` and `map` cut every image into that many
+    line bands, read the bands concurrently and stitch their text back together.
+    With `confidences` they return `OCRText` built from `image_to_data`.
+    """
+    name = 'base'
+
+    def __init__(self, workers=1, lang='eng', tiles=1, confidences=False):
+        self.workers = workers
+        self.lang = lang
+        self.tiles = tiles
+        self.confidences = confidences
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix=f'ocr-{self.name}'
+                )
+        return self._pool
+
+    def image_to_string(self, image):
+        raise NotImplementedError
+
+    def image_to_data(self, image) -> list[OCRWord]:
+        raise NotImplementedError
+
+    def recognise(self, image):
+        """Plain text, or `OCRText` with the words when reading confidences"""
+        if self.confidences:
+            return OCRText.from_words(self.image_to_data(image))
+        return self.image_to_string(image)
+
+    def submit(self, image):
+        """Queue an image, returns a Future resolving to its text"""
+        if self.tiles > 1:
+            image = as_image(image)
+            bands = line_bands(image, self.tiles)
+            if len(bands) > 1:
+                width = image.width
+                futures = [
+                    self.pool.submit(self.recognise, image.crop((0, top, width, bottom)))
+                    for top, bottom, _ in bands
+                    ]
+                paragraphs = [paragraph for _, _, paragraph in bands]
+                return gather(futures, lambda texts: stitch(texts, paragraphs))
+        return self.pool.submit(self.recognise, image)
+
+    def read(self, image):
+        """
+        Read one image, in parallel line bands when `tiles` > 1.
+        It runs on the worker pool like `submit`, so it uses the per-thread
+        state `warmup` prepared rather than loading its own on the calling thread.
+        """
+        return self.submit(image).result()
+
+    def map(self, images):
+        """Read a batch of images concurrently, results keep the input order"""
+        if self.tiles > 1:
+            return [future.result() for future in [self.submit(image) for image in images]]
+        return list(self.pool.map(self.recognise, images))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class PytesseractEngine(OCREngine):
+    """Start a tesseract process per call, as `pytesseract` does"""
+    name = 'pytesseract'
+
+    def image_to_string(self, image):
+        return pytesseract.image_to_string(as_image(image), lang=self.lang)
+
+    def image_to_data(self, image):
+        data = pytesseract.image_to_data(as_image(image), lang=self.lang, output_type=pytesseract.Output.DICT)
+        words = []
+        lines, paragraphs = {}, {}
+        for i, text in enumerate(data['text']):
+            confidence = float(data['conf'][i])
+            if confidence < 0 or not text.strip():
+                continue
+            paragraph = (data['block_num'][i], data['par_num'][i])
+            line = (*paragraph, data['line_num'][i])
+            words.append(OCRWord(
+                text.strip(), confidence,
+                data['left'][i], data['top'][i], data['width'][i], data['height'][i],
+                lines.setdefault(line, len(lines)),
+                paragraphs.setdefault(paragraph, len(paragraphs)),
+                ))
+        return words
+
+class TesserocrEngine(OCREngine):
+    """
+    Keep one persistent tesseract handle per worker thread,
+    so the language data is loaded once per worker instead of once per call.
+    tesserocr releases the GIL while recognising, so threads run in parallel.
+    """
+    name = 'tesserocr'
+
+    def __init__(self, workers=1, lang='eng', tiles=1, confidences=False):
+        if tesserocr is None:
+            raise ImportError("The 'tesserocr' engine requires the tesserocr package")
+        super().__init__(workers=workers, lang=lang, tiles=tiles, confidences=confidences)
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+
+    @property
+    def api(self):
+        """The handle belonging to the calling thread"""
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def warmup(self):
+        """Load the language data in every worker up front"""
+        barrier = threading.Barrier(self.workers)
+        def load():
+            self.api
+            barrier.wait()
+        for future in [self.pool.submit(load) for _ in range(self.workers)]:
+            future.result()
+
+    def image_to_string(self, image):
+        api = self.api
+        api.SetImage(as_image(image))
+        return api.GetUTF8Text()
+
+    def image_to_data(self, image):
+        api = self.api
+        api.SetImage(as_image(image))
+        api.Recognize()
+        words = []
+        line = paragraph = -1
+        iterator = api.GetIterator()
+        level = tesserocr.RIL.WORD
+        while not iterator.Empty(level):
+            if iterator.IsAtBeginningOf(tesserocr.RIL.PARA):
+                paragraph += 1
+            if iterator.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line += 1
+            text = iterator.GetUTF8Text(level)
+            if text and text.strip():
+                left, top, right, bottom = iterator.BoundingBox(level)
+                words.append(OCRWord(
+                    text.strip(), iterator.Confidence(level),
+                    left, top, right - left, bottom - top,
+                    line, paragraph,
+                    ))
+            if not iterator.Next(level):
+                break
+        return words
+
+    def close(self):
+        super().close()
+        with self._lock:
+            for api in self._apis:
+                api.End()
+            self._apis = []
+
+ENGINES = {
+    'pytesseract': PytesseractEngine,
+    'tesserocr': TesserocrEngine,
+}
+
+def get_engine(name='auto', workers=1, lang='eng', tiles=1, confidences=False):
+    """Build an OCR engine, 'auto' prefers persistent tesserocr workers when installed"""
+    if name == 'auto':
+        name = 'tesserocr' if tesserocr is not None else 'pytesseract'
+    if name not in ENGINES:
+        raise ValueError(f"Unknown OCR engine '{name}', choose from {list(ENGINES)}")
+    return ENGINES[name](workers=workers, lang=lang, tiles=tiles, confidences=confidences)
@@ -0,0 +1,166 @@
+"""NumPy preprocessing of screen grabs before OCR: grayscale, adaptive threshold, trim and rescale."""
+import numpy as np
+from PIL import Image
+
+from timer import tracker
+
+PRESETS = {
+    'none': None,
+    'gray': dict(threshold=False, trim=False, scale=1),
+    'binary': dict(threshold=True, trim=True, scale=1),
+    'binary2x': dict(threshold=True, trim=True, scale=2),
+    'binary3x': dict(threshold=True, trim=True, scale=3),
+}
+
+class _Buffers():
+    """Work arrays for one frame shape"""
+    def __init__(self, height, width, block, scale, depth):
+        self.gray = np.empty((height, width), dtype=np.float32)
+        self.scratch = np.empty((height, width), dtype=np.float32)
+        self.integral = np.zeros((height+1, width+1), dtype=np.float64)
+        self.rows = np.empty((height, width+1), dtype=np.float64)
+        self.local = np.empty((height, width), dtype=np.float64)
+        self.corner = np.empty((height, width), dtype=np.float64)
+        self.mask = np.empty((height, width), dtype=bool)
+
+        # Window bounds per row and column, clipped at the borders, and 1/area per pixel
+        radius = block // 2
+        self.y0 = np.clip(np.arange(height) - radius, 0, height)
+        self.y1 = np.clip(np.arange(height) + radius + 1, 0, height)
+        self.x0 = np.clip(np.arange(width) - radius, 0, width)
+        self.x1 = np.clip(np.arange(width) + radius + 1, 0, width)
+        self.inverse_area = 1. / np.outer(self.y1 - self.y0, self.x1 - self.x0)
+
+        # Output images are handed to OCR workers, so rotate through `depth` of them,
+        # each with room for the enlarged copy behind the full size one
+        size = height*width*(1 + scale*scale if scale > 1 else 1)
+        self.outputs = [np.empty(size, dtype=np.uint8) for _ in range(depth)]
+        self.next = 0
+
+    def output(self):
+        out = self.outputs[self.next]
+        self.next = (self.next + 1) % len(self.outputs)
+        return out
+
+class Preprocessor():
+    """
+    Turn a screen grab into the kind of image tesseract reads fastest:
+    grayscale, binarized against the local mean of a `block` x `block` window
+    (so uneven backgrounds and dark mode work), with blank margins trimmed and
+    optionally enlarged by an integer `scale` towards the resolution tesseract
+    is trained on.
+    All work arrays are allocated once per frame shape and reused, the output
+    rotates through `depth` buffers so frames still being read are not
+    overwritten, keep it above the number of frames in flight.
+    """
+    def __init__(self, threshold=True, block=31, offset=10, trim=True, margin=8, scale=1, depth=4, shapes=4):
+        self.threshold = threshold
+        self.block = block
+        self.offset = offset
+        self.trim = trim
+        self.margin = margin
+        self.scale = scale
+        self.depth = depth
+        self.shapes = shapes
+        self._buffers = {}
+
+    @classmethod
+    def from_preset(cls, name, **kwargs):
+        """A Preprocessor for one of `PRESETS`, None for 'none'"""
+        preset = PRESETS[name]
+        if preset is None:
+            return None
+        return cls(**{**preset, **kwargs})
+
+    def buffers(self, height, width):
+        key = (height, width)
+        buffers = self._buffers.get(key)
+        if buffers is None:
+            # Registration strips vary in height, keep only the most recent shapes
+            if len(self._buffers) >= self.shapes:
+                self._buffers.pop(next(iter(self._buffers)))
+            buffers = _Buffers(height, width, self.block, self.scale, self.depth)
+            self._buffers[key] = buffers
+        return buffers
+
+    def grayscale(self, rgb, b):
+        """ITU-R 601 luma into b.gray"""
+        np.multiply(rgb[..., 0], .299, out=b.gray)
+        np.multiply(rgb[..., 1], .587, out=b.scratch)
+        np.add(b.gray, b.scratch, out=b.gray)
+        np.multiply(rgb[..., 2], .114, out=b.scratch)
+        np.add(b.gray, b.scratch, out=b.gray)
+        return b.gray
+
+    def binarize(self, gray, out, b):
+        """Black where a pixel is darker than its local mean minus `offset`, white elsewhere"""
+        # Summed area table, then window sums from its four corners
+        np.cumsum(gray, axis=0, out=b.integral[1:, 1:])
+        np.cumsum(b.integral[1:, 1:], axis=1, out=b.integral[1:, 1:])
+
+        np.take(b.integral, b.y1, axis=0, out=b.rows)
+        np.take(b.rows, b.x1, axis=1, out=b.local)
+        np.take(b.rows, b.x0, axis=1, out=b.corner)
+        np.subtract(b.local, b.corner, out=b.local)
+        np.take(b.integral, b.y0, axis=0, out=b.rows)
+        np.take(b.rows, b.x0, axis=1, out=b.corner)
+        np.add(b.local, b.corner, out=b.local)
+        np.take(b.rows, b.x1, axis=1, out=b.corner)
+        np.subtract(b.local, b.corner, out=b.local)
+        np.multiply(b.local, b.inverse_area, out=b.local)
+
+        # Light text on a dark background: compare the other way round
+        height, width = gray.shape
+        if b.integral[-1, -1] < 128*height*width:
+            np.add(b.local, self.offset, out=b.local)
+            np.less_equal(gray, b.local, out=b.mask)
+        else:
+            np.subtract(b.local, self.offset, out=b.local)
+            np.greater_equal(gray, b.local, out=b.mask)
+        np.multiply(b.mask, 255, out=out, casting='unsafe')
+        return out
+
+    def bounds(self, white):
+        """Rows and columns holding ink, widened by `margin`"""
+        rows = np.flatnonzero(~white.all(axis=1))
+        columns = np.flatnonzero(~white.all(axis=0))
+        if len(rows) == 0:
+            return slice(None), slice(None)
+        height, width = white.shape
+        return (
+            slice(max(0, rows[0]-self.margin), min(height, rows[-1]+1+self.margin)),
+            slice(max(0, columns[0]-self.margin), min(width, columns[-1]+1+self.margin)),
+            )
+
+    def __call__(self, image):
+        """Preprocess a PIL image, returns a grayscale PIL image"""
+        tracker.start('Preprocess')
+
+        rgb = np.asarray(image.convert('RGB'))
+        height, width = rgb.shape[:2]
+        b = self.buffers(height, width)
+        flat = b.output()
+
+        gray = self.grayscale(rgb, b)
+        result = flat[:height*width].reshape(height, width)
+        if self.threshold:
+            self.binarize(gray, result, b)
+        else:
+            np.copyto(result, gray, casting='unsafe')
+
+        if self.trim and self.threshold:
+            rows, columns = self.bounds(b.mask)
+            result = result[rows, columns]
+
+        if self.scale > 1:
+            # Nearest neighbour enlargement into the back of the same buffer
+            h, w = result.shape
+            s = self.scale
+            enlarged = flat[height*width:height*width + h*s*w*s].reshape(h, s, w, s)
+            enlarged[...] = result[:, None, :, None]
+            result = enlarged.reshape(h*s, w*s)
+
+        image = Image.fromarray(result)
+
+        tracker.stop('Preprocess')
+        return image
@@ -0,0 +1,184 @@
+"""Sampling profiler whose samples are grouped by the running tracker stage."""
+import os
+import re
+import sys
+import json
+import time
+import threading
+
+from timer import tracker, _write_atomic
+
+# Leaf frames of threads that are only waiting for work
+IDLE = ('threading.py', 'queue.py', 'selectors.py')
+
+class SamplingProfiler():
+    """
+    Every `interval` seconds, take the Python stack of every thread and file it
+    under the innermost `tracker` label running on that thread, so the time of a
+    stage such as 'align_sequences: Merge amalgamations' is broken down into the
+    functions it spends it in. Threads without a label, like the OCR workers,
+    are filed under their thread name, unless they are idle.
+    Sampling runs on its own thread and costs one walk over the stacks per
+    interval, the profiled code is not touched. Samples are wall clock, so
+    waiting for OCR or for the screen shows up too.
+    """
+    def __init__(self, interval=.005, tracker=tracker):
+        self.interval = interval
+        self.tracker = tracker
+        self.samples = {}
+        self.names = {}
+        self.thread = None
+        self.running = threading.Event()
+        self.started = self.elapsed = 0.
+        self.ticks = 0
+
+    def start(self):
+        self.running.set()
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.elapsed += time.perf_counter() - self.started
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _name(self, code):
+        """'function (file:line)' for a code object, cached"""
+        name = self.names.get(code)
+        if name is None:
+            name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self.names[code] = name
+        return name
+
+    def _run(self):
+        own = threading.get_ident()
+        while self.running.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                label = self.tracker.label(ident)
+                if label is None:
+                    if os.path.basename(frame.f_code.co_filename) in IDLE:
+                        continue
+                    label = f"[{names.get(ident, ident)}]"
+
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack = tuple(reversed(stack))
+
+                stage = self.samples.setdefault(label, {})
+                stage[stack] = stage.get(stack, 0) + 1
+            self.ticks += 1
+            time.sleep(self.interval)
+
+    @property
+    def period(self):
+        """Measured seconds per sample, a little over `interval`"""
+        return self.elapsed / self.ticks if self.ticks else self.interval
+
+    def stages(self):
+        """Stages by number of samples, most first"""
+        return sorted(self.samples, key=lambda label: -sum(self.samples[label].values()))
+
+    def collapsed(self, label=None):
+        """
+        Collapsed stacks, one 'frame;frame;frame count' line per stack, for
+        flamegraph.pl, speedscope or inferno. Without a `label` all stages are
+        included with the stage as the root frame.
+        """
+        lines = []
+        for stage in ([label] if label else self.stages()):
+            root = [] if label else [stage.replace(';', ',')]
+            for stack, n in self.samples[stage].items():
+                frames = root + [self._name(code).replace(';', ',') for code in stack]
+                lines.append(f"{';'.join(frames)} {n}")
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self):
+        """A speedscope document with one sampled profile per stage"""
+        frames = []
+        index = {}
+        profiles = []
+        period = self.period
+        for stage in self.stages():
+            samples = []
+            weights = []
+            for stack, n in self.samples[stage].items():
+                sample = []
+                for code in stack:
+                    if code not in index:
+                        index[code] = len(frames)
+                        frames.append({
+                            'name': code.co_name,
+                            'file': code.co_filename,
+                            'line': code.co_firstlineno,
+                            })
+                    sample.append(index[code])
+                samples.append(sample)
+                weights.append(n*period)
+            profiles.append({
+                'type': 'sampled',
+                'name': stage,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+                })
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': profiles,
+            'name': 'ocr capture',
+            'exporter': 'profiler.py',
+            }
+
+    def save(self, prefix):
+        """
+        Write `prefix`.speedscope.json, `prefix`.folded with every stage and
+        `prefix`.STAGE.folded per stage, returns the paths
+        """
+        paths = [prefix + '.speedscope.json', prefix + '.folded']
+        _write_atomic(paths[0], json.dumps(self.speedscope()))
+        _write_atomic(paths[1], self.collapsed())
+        for stage in self.stages():
+            path = f"{prefix}.{_slug(stage)}.folded"
+            _write_atomic(path, self.collapsed(stage))
+            paths.append(path)
+        return paths
+
+    def report(self, top=5):
+        """Samples per stage and the functions they were spent in"""
+        total = sum(sum(stage.values()) for stage in self.samples.values()) or 1
+        lines = [
+            f"Profiled {self.elapsed:.1f}s, a sample every {1000*self.period:.1f}ms",
+            f"{'stage':<45}{'samples':>8}{'share':>8}",
+            ]
+        for stage in self.stages():
+            counts = self.samples[stage]
+            n = sum(counts.values())
+            lines.append(f"{stage:<45}{n:>8}{100*n/total:>7.1f}%")
+
+            # Leaf functions, the time spent in the function itself
+            leaves = {}
+            for stack, k in counts.items():
+                leaves[stack[-1]] = leaves.get(stack[-1], 0) + k
+            for code, k in sorted(leaves.items(), key=lambda item: -item[1])[:top]:
+                lines.append(f"    {self._name(code):<41}{k:>8}{100*k/n:>7.1f}%")
+        return '\n'.join(lines)
+
+def _slug(label):
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', label).strip('_') or 'stage'
@@ -0,0 +1,71 @@
+"""Several named screen regions read side by side, each into its own document."""
+import argparse
+
+class Region():
+    """
+    One watched part of the screen and everything that belongs to its document:
+    the merged text, the output sink, frame deduplication, the scroll step and
+    the end check, which looks for the region's own `final_text`.
+    """
+    def __init__(self, name, rect, priority=1., final_text=None):
+        self.name = name
+        self.rect = rect
+        self.priority = priority
+        self.final_text = final_text
+        self.document = None
+        self.sink = None
+        self.frames = None
+        self.stopper = None
+        self.registration = None
+        self.steps = None
+        self.scrolled = 0
+        self.page = 0
+        self.finished = False
+
+    @property
+    def title(self):
+        return self.name
+
+    def __repr__(self):
+        return f"Region({self.name!r}, {self.rect}, priority={self.priority}, final_text={self.final_text!r})"
+
+def parse_region(spec:str) -> Region:
+    """`NAME=X,Y,W,H[,PRIORITY]`, optionally followed by `:FINAL TEXT`, for argparse"""
+    name, _, rest = spec.partition('=')
+    numbers, _, final_text = rest.partition(':')
+    try:
+        numbers = [float(n) for n in numbers.split(',')]
+    except ValueError:
+        numbers = []
+    if not name or len(numbers) not in (4, 5):
+        raise argparse.ArgumentTypeError(f"Expected NAME=X,Y,W,H[,PRIORITY][:FINAL TEXT], got '{spec}'")
+    rect = [int(n) for n in numbers[:4]]
+    priority = numbers[4] if len(numbers) == 5 else 1.
+    if priority <= 0:
+        raise argparse.ArgumentTypeError(f"Priority of region '{name}' must be positive")
+    return Region(name, rect, priority, final_text or None)
+
+class Scheduler():
+    """
+    Pick the region to capture next.
+    'round_robin' takes the unfinished regions in turn, 'priority' uses stride
+    scheduling, so a region with twice the priority is captured twice as often
+    and no region starves.
+    """
+    def __init__(self, regions, policy='round_robin'):
+        self.regions = list(regions)
+        self.policy = policy
+        self.passes = {region.name: 0. for region in self.regions}
+
+    def stride(self, region):
+        return 1. if self.policy == 'round_robin' else 1. / region.priority
+
+    def next(self):
+        """The next region to capture, None once all of them are finished"""
+        active = [region for region in self.regions if not region.finished]
+        if not active:
+            return None
+        # Ties go to the region listed first, which makes round robin cycle in order
+        region = min(active, key=lambda r: self.passes[r.name])
+        self.passes[region.name] += self.stride(region)
+        return region
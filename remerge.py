@@ -0,0 +1,194 @@
+"""
+Merge the pages of a captured session again, offline and in parallel.
+
+Pages come from the per-page records of `--jsonl`, a folder of page .txt files,
+or a recorded session directory, which is read with OCR first. Adjacent pages
+are merged pairwise in a process pool and the results are merged up a balanced
+tree. Each node keeps the length of its first page, so every seam is aligned
+over the same window as in the live, left to right merge, and the result is the
+same as long as a page only overlaps its neighbours.
+Every option that takes several values is swept, one output per combination.
+
+python remerge.py ./data/book.jsonl --title=book-remerged --window 1.0 1.05 1.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from contextlib import nullcontext
+from multiprocessing import Pool
+
+from controls import datafolder, save_txt
+from document import DocumentBuffer
+from error_correction import OCRMerger, OverlapDetector
+
+SCORES = ('match_score', 'mismatch_score', 'open_gap_score', 'extend_gap_score')
+
+def load_pages(path, ocr_engine='auto', workers=2, lang='eng'):
+    """Page texts in order from a .jsonl file, a folder of .txt pages or a recorded session"""
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line)['ocr'] for line in f if line.strip()]
+
+    if os.path.exists(os.path.join(path, 'session.jsonl')):
+        from backends import ReplayBackend
+        from ocr import get_engine
+        replay = ReplayBackend(path)
+        images = [replay.grab(None) for _ in range(len(replay))]
+        with get_engine(ocr_engine, workers=workers, lang=lang) as engine:
+            texts = [text.strip() for text in engine.map(images)]
+        # Unchanged frames read the same, keep one of each
+        return [text for i, text in enumerate(texts) if text and (i == 0 or text != texts[i-1])]
+
+    names = sorted(n for n in os.listdir(path) if n.endswith('.txt'))
+    pages = []
+    for name in names:
+        with open(os.path.join(path, name), 'r', encoding='utf-8') as f:
+            pages.append(f.read().strip())
+    return pages
+
+# One merger per process and setting, kept across tasks
+_mergers = {}
+
+def get_merger(settings):
+    key = tuple(sorted((k, v) for k, v in settings.items() if k in ('spell_engine', 'merge_strategy', 'anchor_k', 'fast_overlap')))
+    if key not in _mergers:
+        _mergers[key] = OCRMerger(
+            spell_engine=settings['spell_engine'],
+            strategy=settings['merge_strategy'],
+            anchor_k=settings['anchor_k'],
+            overlap=OverlapDetector() if settings['fast_overlap'] else None,
+            )
+    return _mergers[key]
+
+def merge_nodes(left, right, settings):
+    """
+    Merge two merged runs of pages, each as (text, length of its first page).
+    The seam is aligned over the tail of `left` and the first page of `right`,
+    like `run.merge_page` does with a new page.
+    """
+    text1, first1 = left
+    text2, first2 = right
+    if not text1:
+        return right
+    if not text2:
+        return left
+
+    window = int(first2 * settings['window'])
+    if window <= 0:
+        return text1 + '\n' + text2, first1
+
+    # Start the window at a word and end the head at whitespace, so the seams join cleanly
+    window = DocumentBuffer(text1).word_window(window)
+    head = len(text2)
+    if first2 < len(text2):
+        ends = [i for i in (text2.find(' ', first2), text2.find('\n', first2)) if i >= 0]
+        head = min(ends) if ends else len(text2)
+
+    merged = get_merger(settings).merge(
+        text1[len(text1)-window:],
+        text2[:head],
+        expected_overlap=settings['expected_overlap'],
+        **{score: settings[score] for score in SCORES}
+        )
+    return text1[:len(text1)-window] + merged + text2[head:], first1
+
+def _merge_task(left, right, settings):
+    return merge_nodes(left, right, settings)
+
+def tree_merge(pages, settings, pool=None):
+    """Merge pairs of neighbours level by level until one document is left, in `pool` if given"""
+    starmap = pool.starmap if pool is not None else lambda task, pairs: list(itertools.starmap(task, pairs))
+    nodes = [(page, len(page)) for page in pages]
+    while len(nodes) > 1:
+        pairs = [(nodes[i], nodes[i+1], settings) for i in range(0, len(nodes) - 1, 2)]
+        merged = starmap(_merge_task, pairs)
+        if len(nodes) % 2:
+            merged.append(nodes[-1])
+        nodes = merged
+    return nodes[0][0] if nodes else ""
+
+def sequential_merge(pages, settings):
+    """Left to right merge, as the live capture does, for comparison"""
+    node = ("", 0)
+    for page in pages:
+        node = merge_nodes(node, (page, len(page)), settings) if node[0] else (page, len(page))
+    return node[0]
+
+def sweep(args):
+    """Every combination of the swept options"""
+    swept = {
+        'window': args.window,
+        'merge_strategy': args.merge_strategy,
+        'anchor_k': args.anchor_k,
+        **{score: getattr(args, score) for score in SCORES},
+        }
+    fixed = {
+        'spell_engine': args.spell_engine,
+        'fast_overlap': args.fast_overlap,
+        'expected_overlap': args.expected_overlap,
+        }
+    names = list(swept)
+    for values in itertools.product(*swept.values()):
+        yield {**fixed, **dict(zip(names, values))}, {k: v for k, v in zip(names, values) if len(swept[k]) > 1}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", help="<title>.jsonl from --jsonl, a folder of page .txt files or a recorded session directory")
+    parser.add_argument("--title", default="remerged", type=str, help="Output title, swept outputs get a -<n> suffix. Default is 'remerged'")
+    parser.add_argument("--processes", default=os.cpu_count(), type=int, help="Merge processes, default is the number of cores")
+    parser.add_argument("--sequential", action='store_true', help="Merge left to right in this process instead, for comparison")
+    parser.add_argument("--reference", default=None, type=str, help="Text file to report the character error rate against")
+    parser.add_argument("--window", nargs='+', default=[1.05], type=float)
+    parser.add_argument("--merge_strategy", nargs='+', default=['characters'], choices=['characters', 'words'])
+    parser.add_argument("--anchor_k", nargs='+', default=[0], type=int)
+    parser.add_argument("--match_score", nargs='+', default=[2], type=float)
+    parser.add_argument("--mismatch_score", nargs='+', default=[-1], type=float)
+    parser.add_argument("--open_gap_score", nargs='+', default=[-.5], type=float)
+    parser.add_argument("--extend_gap_score", nargs='+', default=[-.1], type=float)
+    parser.add_argument("--expected_overlap", default=None, type=float, help="Fraction of a page expected to repeat the previous one")
+    parser.add_argument("--spell_engine", default='pyspellchecker', choices=['pyspellchecker', 'symspell'])
+    parser.add_argument("--fast_overlap", action='store_true')
+    parser.add_argument("--ocr_engine", default='auto', type=str, help="OCR engine for recorded sessions")
+    parser.add_argument("--workers", default=2, type=int, help="OCR workers for recorded sessions")
+    parser.add_argument("--lang", default='eng', type=str)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.ocr_engine, args.workers, args.lang)
+    if not pages:
+        sys.exit(f"No pages found in {args.pages}")
+    print(f"{len(pages)} pages", flush=True)
+
+    reference = None
+    if args.reference:
+        from benchmarks import cer
+        with open(args.reference, 'r', encoding='utf-8') as f:
+            reference = f.read()
+
+    # Processes only pay off when there are several pairs of pages to merge at once
+    configurations = list(sweep(args))
+    fanned = not args.sequential and len(pages) > 2 and args.processes > 1
+    with Pool(args.processes) if fanned else nullcontext() as pool:
+        for n, (settings, varied) in enumerate(configurations):
+            start = time.perf_counter()
+            if args.sequential:
+                text = sequential_merge(pages, settings)
+            else:
+                text = tree_merge(pages, settings, pool)
+            elapsed = time.perf_counter() - start
+
+            title = args.title if len(configurations) == 1 else f"{args.title}-{n}"
+            os.makedirs(datafolder, exist_ok=True)
+            save_txt(text, title)
+
+            line = f"{title:<24}{elapsed:>8.2f}s {len(text):>9} chars"
+            if reference is not None:
+                line += f"  CER {cer(reference, text):.2%}"
+            if varied:
+                line += "  " + " ".join(f"{k}={v}" for k, v in varied.items())
+            print(line, flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -2,106 +2,460 @@
 # default
 import sys
 import argparse
-import tkinter as tk
 import threading
-from queue import Queue
+from queue import Queue, Full, Empty
 import time
 import random
-# env
-import pytesseract
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import NamedTuple
 # local
+from ocr import get_engine, ENGINES
+from document import DocumentBuffer
+from sinks import TextSink, JsonlSink, MultiSink, resume
+from frames import FrameChangeDetector, ScrollRegistration
+from stopping import StopDetector
+from regions import Region, Scheduler, parse_region
+from preprocess import Preprocessor, PRESETS
+from backends import get_backend
+from controller import StepController
 from error_correction import *
 from controls import *
 from timer import tracker
+from startup import StartupProfile, import_times
+from profiler import SamplingProfiler
 
-Merger = OCRMerger()
+# Built by `warmup` while the countdown runs
+Merger = None
 
-def sequential(args):
-    """Sequential bookreader"""
+def warmup(args, profile):
+    """
+    Build the merger and the OCR engine and warm their caches,
+    so the dictionary and aligner are ready by the time capture starts.
+    """
+    global Merger
+
+    with profile.measure('OCRMerger (dictionary)'):
+        Merger = OCRMerger(
+            spell_engine=args.spell_engine,
+            strategy=args.merge_strategy,
+            anchor_k=args.anchor_k,
+            overlap=OverlapDetector() if args.fast_overlap else None,
+            confidence=args.confidence or None,
+            )
 
-    # Position
-    x, y, width, height = args.screen_rect
-    # Mouse wheel 'notches' till full screen
+    with profile.measure('PairwiseAligner'):
+        Merger.get_aligner()
+
+    with profile.measure('Spelling warm-up'):
+        Merger.is_word_correct('warmup')
+        Merger.spell.correction('warmup')
+
+    with profile.measure('OCR engine'):
+        engine = get_engine(args.ocr_engine, workers=args.workers, lang=args.lang, tiles=args.tiles, confidences=bool(args.confidence))
+        if hasattr(engine, 'warmup'):
+            engine.warmup()
+
+    return engine
+
+def open_document(args, title=None):
+    """Empty document buffer, or the state of an interrupted capture with --resume"""
+    state = resume(title or args.title) if args.resume else None
+    if state is None:
+        return DocumentBuffer(margin=2*args.window)
+    committed, tail = state
+    return DocumentBuffer.from_text(committed, tail, margin=2*args.window)
+
+def open_sinks(args, title=None):
+    """Plain text output, plus per-page JSONL records with --jsonl"""
+    title = title or args.title
+    sinks = [TextSink(title, fsync_every=args.fsync_every, resume=args.resume)]
+    if args.jsonl:
+        sinks.append(JsonlSink(title, fsync_every=args.fsync_every, resume=args.resume))
+    return MultiSink(*sinks)
+
+def open_registration(args):
+    """Scroll registration to OCR only newly revealed rows, with --register"""
+    if not args.register:
+        return None
+    return ScrollRegistration(min_confidence=args.register_confidence, overlap=args.register_overlap, lines=args.register_lines)
+
+def open_preprocessor(args):
+    """Image cleanup before OCR with --preprocess, None for 'none'"""
+    # Enough output buffers for every frame that can be waiting for or in OCR
+    depth = args.workers + len(args.region) + 3
+    return Preprocessor.from_preset(args.preprocess, depth=depth)
+
+def scroll_notches(args, rect=None):
+    """Mouse wheel 'notches' till full screen"""
+    x, y, width, height = rect or args.screen_rect
     rad = height-y
-    notches = math.floor(rad/args.notchpixels)
+    return math.floor(rad/args.notchpixels)
+
+def expected_overlap(args, rect=None, notches=None):
+    """Fraction of the region that is still on screen after scrolling `notches`"""
+    x, y, width, height = rect or args.screen_rect
+    if notches is None:
+        notches = scroll_notches(args, rect)
+    return max(0., 1 - notches*args.notchpixels/height)
+
+def open_step_controller(args, rect=None):
+    """Notches per scroll, adapted to the measured overlap with --adaptive_scroll"""
+    x, y, width, height = rect or args.screen_rect
+    if not args.adaptive_scroll:
+        notches = scroll_notches(args, rect)
+        return StepController(notches, notches, notches, adaptive=False)
+
+    # Scroll past the tail the end check compares, and at most two pages
+    least = math.floor(args.tail_fraction*height/args.notchpixels) + 1
+    most = max(least, math.ceil(2*height/args.notchpixels))
+
+    # Start at half the step --notchpixels suggests for the target overlap, in case it is off,
+    # the first merges then measure the real step
+    notches = min(max(least, math.floor((1 - args.target_overlap)*height/args.notchpixels/2)), most)
+    return StepController(notches, most, least, target=args.target_overlap, min_identity=args.min_seam_identity)
+
+def page_overlap(args, rect, ocr, shift=None):
+    """Fraction of the page seen before the scroll, from the registration shift or the merge seam"""
+    if shift is not None:
+        x, y, width, height = rect or args.screen_rect
+        return 1 - shift/height
+    if Merger.seam is None or not ocr:
+        return None
+    return Merger.seam.repeated / len(ocr)
+
+def adapt_scroll(steps, args, rect, ocr, added, scrolled, shift=None):
+    """Feed the last merge back to the step controller, returns the notches for the next scroll"""
+    if shift is not None:
+        # A strip only holds a few lines of seen text, so its seam says little
+        # about the scroll, the registration found the frames overlapping
+        identity = 1.
+    else:
+        identity = Merger.seam.identity if Merger.seam is not None else 0.
+    return steps.update(scrolled, page_overlap(args, rect, ocr, shift), identity, added)
+
+def page_text(ocr):
+    """Stripped OCR text, after handing its word confidences to the merger"""
+    Merger.observe(ocr)
+    return ocr.strip()
+
+def line_length(text, lines):
+    """Length of the first `lines` lines of text in `text`, blank lines not counted"""
+    size = -1
+    for line in text.split('\n'):
+        if lines <= 0:
+            break
+        size += len(line) + 1
+        lines -= bool(line.strip())
+    return max(0, min(size, len(text)))
+
+def merge_page(document, ocr, args, rect=None, notches=None, lines=None):
+    """
+    Merge a new page of OCR text into the document's mutable tail,
+    returns the number of characters it added. For a registration strip
+    `lines` are the text lines at its top that were on screen before.
+    """
+    before = len(document)
+    Merger.seam = None
+
+    # Store window to use as input to the alignment process
+    overlap = expected_overlap(args, rect, notches)
+    window = int(len(ocr) * args.window)
+    head = None
+    if lines:
+        # Only the top lines of a strip repeat the store, align just those against the
+        # store's last lines, one more for a line the previous page cut off at the bottom
+        head = line_length(ocr, lines)
+        window = document.line_window(lines + 1)
+        overlap = head / len(ocr) if ocr else 0.
+
+    # Match and align to store
+    if len(document) == 0:
+        document.replace_tail(0, ocr)
+
+    elif window > 0:
+
+        tracker.start('align_sequences')
+
+        # Start the window at a word, the merged words are joined without the whitespace before them
+        window = document.word_window(window)
+
+        amalgamation = Merger.merge(
+            document.tail(window),
+            ocr,
+            expected_overlap=overlap,
+            head=head
+            )
+        document.replace_tail(window, amalgamation)
+
+        tracker.stop('align_sequences')
+
+    return len(document) - before
 
-    # Conditional loop
-    store = ""
-    finished = False
-    prevtail = ""
-    while finished is False:
+def open_stop_detector(args, final_text=None):
+    """End-of-document check for the final text, --final_text by default, and the repeated page tail"""
+    return StopDetector(final_text or args.final_text, max_error=args.max_error, tail_fraction=args.tail_fraction)
+
+def reached_end(stopper, document, ocr, args):
+    """Check the newly merged text for the end of the document"""
+    tracker.start('End check')
+    finished = stopper.check(document, ocr)
+    tracker.stop('End check')
+    if finished and args.verbose:
+        print(f"End of document: {stopper.reason}", flush=True)
+    return finished
+
+def stalled_end(region, stalled, args):
+    """
+    End the region's document on grabs that stopped changing, if its end check
+    agrees. A page still rendering looks the same, so say so when it happens.
+    """
+    if not stalled or not region.stopper.stalled():
+        return False
+    print(f"End of {region.name or 'document'}: {region.stopper.reason}, {args.stall_frames} grabs in a row did not change", flush=True)
+    return True
+
+def open_region(args, region=None):
+    """
+    Give a region its document, output, frame deduplication, registration,
+    scroll step and end check. Without `region` screen_rect is read into --title.
+    """
+    if region is None:
+        region = Region(args.title, args.screen_rect)
+    region.document = open_document(args, region.title)
+    region.sink = open_sinks(args, region.title)
+    region.frames = FrameChangeDetector(args.frame_threshold, args.stall_frames)
+    region.stopper = open_stop_detector(args, region.final_text)
+    region.registration = open_registration(args)
+    region.steps = open_step_controller(args, region.rect)
+    return region
+
+class Page(NamedTuple):
+    """A grab handed from the capture thread to the merging thread"""
+    region: Region
+    future: Future | None   # OCR text, None when the frame did not change
+    scrolled: int           # notches scrolled since the region's previous page
+    shift: int | None = None    # registration shift, None for a full frame
+    lines: int | None = None    # text lines at the top of a strip seen before
+    stalled: bool = False   # the last --stall_frames grabs did not change
+
+def prepare_frame(region, image, preprocess, args):
+    """
+    Get a grab of `region` ready for OCR, None when it did not change since the
+    last frame read. Returns the image, cut down to the rows scrolled into view
+    with --register and cleaned up with --preprocess, the registration shift
+    and the text lines at the top of the strip that were seen before.
+    """
+    # Skip OCR and merging when scrolling did not change the frame
+    if not region.frames.changed(image):
+        return None
+
+    # Only read the rows scrolled into view
+    shift = lines = None
+    if region.registration is not None:
+        image = region.registration.strip(image, expected=region.scrolled*args.notchpixels)
+        shift, lines = region.registration.shift, region.registration.lines_seen
+
+    # Clean up for OCR
+    if preprocess is not None:
+        image = preprocess(image)
+    return image, shift, lines
+
+def scroll_region(region, backend):
+    """Scroll the region by the notches its step controller asks for"""
+    notches = region.steps.notches
+    backend.scroll(region.rect, notches)
+    region.scrolled += notches
+
+def merge_region_page(region, ocr, args, scrolled, shift=None, lines=None):
+    """Merge a page of OCR text into the region's document, write out what got committed and check for the end"""
+
+    # Match and align to the region's store
+    added = merge_page(region.document, ocr, args, region.rect, notches=scrolled or None, lines=lines)
+
+    # Scroll further or less far, depending on how the pages overlapped
+    adapt_scroll(region.steps, args, region.rect, ocr, added, scrolled, shift)
+
+    # Append committed text to the region's output
+    region.sink.update(region.document.pop_committed(), region.document.tail(), region.page, ocr)
+    region.page += 1
+
+    # Check for the end of the region's document
+    region.finished = reached_end(region.stopper, region.document, ocr, args)
+
+def close_region(region, args):
+    """Write the remaining tail of the region's document"""
+    region.sink.close(region.document.tail())
+    if args.verbose:
+        print(f"{region.name}: {region.steps.report()}", flush=True)
+
+def sequential(args, engine, backend):
+    """Sequential bookreader"""
+    region = open_region(args)
+    preprocess = open_preprocessor(args)
+    while not region.finished:
 
         tracker.start('Loop')
         tracker.start('From screengrab to string')
 
         # Grab screen
-        image = screengrab(args.screen_rect)
+        frame = prepare_frame(region, backend.grab(region.rect), preprocess, args)
+        if frame is None:
+            tracker.stop('From screengrab to string')
+            scroll_region(region, backend)
+            region.finished = stalled_end(region, region.frames.stalled, args)
+            tracker.stop('Loop')
+            continue
+        image, shift, lines = frame
+        scrolled, region.scrolled = region.scrolled, 0
 
         # Extract text
-        ocr = pytesseract.image_to_string(image)
+        ocr = engine.read(image)
 
         tracker.stop('From screengrab to string')
 
         # Split into words
-        ocr = ocr.strip()
+        ocr = page_text(ocr)
 
-        # Store window to use as input to the alignment process
-        window = int(len(ocr) * args.window)
+        # Merge, write out and check for the end of the document
+        merge_region_page(region, ocr, args, scrolled, shift, lines)
 
-        # Match and align to store
-        if len(store)>0:
-
-            tracker.start('align_sequences')
+        # Scroll down
+        tracker.start('Scroll')
+        scroll_region(region, backend)
+        tracker.stop('Scroll')
 
-            amalgamation = Merger.align_sequences(store[-window:], ocr)
-            store = store[:-window] + amalgamation
+        tracker.stop('Loop')
 
-            tracker.stop('align_sequences')
+        tracker.tick()
 
-        else:
-            store = ocr
+    # Write the remaining tail
+    close_region(region, args)
 
-        tracker.start('Save up')
+    # Close off
+    backend.close()
 
-        # Save to .txt file
-        save_txt(store, args.title)
+def pipelined(args, engine, backend):
+    """
+    Pipelined bookreader: `multiregion` with screen_rect as its only region.
+    Capture and scroll run in their own thread and hand every frame to the
+    OCR engine's worker pool, while merging happens in the calling thread,
+    so that grabbing page N+1, reading page N and merging page N-1 overlap.
+    """
+    multiregion(args, engine, backend, [open_region(args)])
 
-        # Scroll down
-        screenscroll(args.screen_rect, notches)
-        
-        # Correct last 10% of OCR text
-        ocrtail = Merger.correction( ocr[int( -.1 * len(ocr) ):] )
+def multiregion(args, engine, backend, regions=None):
+    """
+    Read several regions at once, each into its own document, the --region
+    options by default.
+    A capture thread visits the regions in the order chosen by the scheduler and
+    hands every frame to the shared OCR worker pool, while the calling thread
+    merges the pages with the shared Merger. Every region keeps its own store,
+    output and end check, and its pages are merged in page order.
+    """
+    if regions is None:
+        regions = [open_region(args, region) for region in args.region]
+    scheduler = Scheduler(regions, args.schedule)
+    preprocess = open_preprocessor(args)
+
+    # Bounded queue of pages in capture order
+    pages = Queue(maxsize=args.workers+len(regions))
+    stop = threading.Event()
+
+    def capture():
+        """Grab, submit and scroll the scheduled regions until told to stop"""
+        try:
+            while not stop.is_set():
+                region = scheduler.next()
+                if region is None:
+                    return
+
+                tracker.start('Capture')
+                image = backend.grab(region.rect)
+                tracker.stop('Capture')
+                frame = prepare_frame(region, image, preprocess, args)
+                if frame is None:
+                    _put(pages, Page(region, None, region.scrolled, stalled=region.frames.stalled), stop)
+                else:
+                    image, shift, lines = frame
+                    _put(pages, Page(region, engine.submit(image), region.scrolled, shift, lines), stop)
+                    region.scrolled = 0
+
+                tracker.start('Scroll')
+                scroll_region(region, backend)
+                tracker.stop('Scroll')
+        except Exception as error:
+            _put(pages, error, stop)
+
+    thread = threading.Thread(target=capture, daemon=True)
+    thread.start()
+
+    # Merge pages as they come in
+    merged = 0
+    started = time.perf_counter()
+    while not all(region.finished for region in regions):
+
+        tracker.start('Wait for OCR')
+        page = pages.get()
+        if isinstance(page, Exception):
+            stop.set()
+            raise page
+        region = page.region
+        if region.finished or page.future is None:
+            # Read past the end, or the frame did not change
+            tracker.stop('Wait for OCR')
+            if not region.finished:
+                region.finished = stalled_end(region, page.stalled, args)
+            continue
+        ocr = page_text(page.future.result())
+        tracker.stop('Wait for OCR')
 
-        # Compare ocr tail to previous tail
-        finished = fuzzy_contains(
-            prevtail,
-            ocrtail,
-            max_error=int(args.max_error*len(args.final_text))
-        )
+        tracker.start('Loop')
 
-        prevtail = ocrtail
+        # Merge, write out and check for the end of the region's document
+        merge_region_page(region, ocr, args, page.scrolled, page.shift, page.lines)
 
-        tracker.stop('Save up')
         tracker.stop('Loop')
 
-        tracker.boxplot()
+        merged += 1
+        if args.verbose:
+            rate = 60 * merged / (time.perf_counter() - started)
+            print(f"Merged page {region.page} of {region.name}, {rate:.1f} pages/minute", flush=True)
+            if Merger.overlap is not None:
+                print(f"Overlap fast path hit rate {Merger.overlap.hit_rate():.0%}", flush=True)
 
-    # Close off
-    close()
+        tracker.tick()
 
-def main():
-    """
-    Do some rudimentary command line argument handling
-    so the user can speicify the area of the screen to watch
-    """
-    EXE = sys.argv[0]
+    # Stop capturing and drop frames read past the end
+    stop.set()
+    _drain(pages)
+    thread.join()
 
-    # Get the size of the screen
-    root = tk.Tk()
-    screen_width = root.winfo_screenwidth()
-    screen_height = root.winfo_screenheight()
+    # Write the remaining tails
+    for region in regions:
+        close_region(region, args)
 
-    # Parse CL arguments
+    # Close off
+    backend.close()
+
+def _put(queue, item, stop, timeout=.1):
+    """Put `item` on a bounded queue, giving up once `stop` is set"""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=timeout)
+            return
+        except Full:
+            continue
+
+def _drain(queue):
+    """Empty a queue without blocking"""
+    while True:
+        try:
+            queue.get_nowait()
+        except Empty:
+            return
+
+def build_parser():
+    """The command line options, also used to run the capture from benchmarks"""
     parser=argparse.ArgumentParser()
 
     # Verbose output
@@ -127,6 +481,25 @@ def main():
         default=notchpixels,
         type=float
         )
+    parser.add_argument(
+        "--adaptive_scroll",
+        help="Start from the step for --target_overlap and adjust the notches per scroll after every page to keep that overlap, measured from the merge or --register",
+        action='store_true'
+        )
+    target_overlap = .5
+    parser.add_argument(
+        "--target_overlap",
+        help=f"Fraction of a page that should overlap the previous one with --adaptive_scroll, the full alignment needs about .4, --fast_overlap manages with .25. Default is {target_overlap}",
+        default=target_overlap,
+        type=float
+        )
+    min_seam_identity = .8
+    parser.add_argument(
+        "--min_seam_identity",
+        help=f"With --adaptive_scroll, halve the step after a merge whose overlap matched less than this, default is {min_seam_identity}",
+        default=min_seam_identity,
+        type=float
+        )
 
     # Alignment window
     window = 1.05
@@ -137,18 +510,311 @@ def main():
         type=float
         )
 
+    # Anchored alignment
+    parser.add_argument(
+        "--anchor_k",
+        help="Length of the exact seed used to restrict alignment to a band around the seam, 0 aligns the whole window. Default is 0",
+        default=0,
+        type=int
+        )
+
+    # Frame deduplication
+    frame_threshold = .002
+    parser.add_argument(
+        "--frame_threshold",
+        help=f"Skip OCR when a grab differs less than this from the last one (mean absolute difference of a 64x64 grayscale thumbnail), default is {frame_threshold}",
+        default=frame_threshold,
+        type=float
+        )
+    stall_frames = 3
+    parser.add_argument(
+        "--stall_frames",
+        help=f"Stop after this many unchanged grabs in a row, as a repeated page tail, so only while --tail_fraction is on. 0 never stops on unchanged grabs. Default is {stall_frames}",
+        default=stall_frames,
+        type=int
+        )
+
+    # Scroll registration
+    parser.add_argument(
+        "--register",
+        help="Estimate the scroll distance from the image and only OCR the newly revealed rows",
+        action='store_true'
+        )
+    register_confidence = .8
+    parser.add_argument(
+        "--register_confidence",
+        help=f"Minimum row correlation to trust the estimated scroll distance, below it the full frame is read. Default is {register_confidence}",
+        default=register_confidence,
+        type=float
+        )
+    register_overlap = 30
+    parser.add_argument(
+        "--register_overlap",
+        help=f"Minimum rows of already seen content kept above the new strip for the text alignment, default is {register_overlap}",
+        default=register_overlap,
+        type=int
+        )
+    register_lines = 3
+    parser.add_argument(
+        "--register_lines",
+        help=f"Text lines of already seen content kept above the new strip, at the line pitch measured on the frame. Default is {register_lines}",
+        default=register_lines,
+        type=int
+        )
+
+    # End of the document
+    parser.add_argument(
+        "--final_text",
+        help="Stop once this text, the last words of the document, has been captured",
+        default=None,
+        type=str
+        )
+    max_error = .1
+    parser.add_argument(
+        "--max_error",
+        help=f"Allowed errors per character when looking for the final text or a repeated page tail, default is {max_error}",
+        default=max_error,
+        type=float
+        )
+    tail_fraction = .1
+    parser.add_argument(
+        "--tail_fraction",
+        help=f"Stop when this last fraction of a page repeats the previous page's, 0 disables the check. Default is {tail_fraction}",
+        default=tail_fraction,
+        type=float
+        )
+
+    # Spelling engine
+    parser.add_argument(
+        "--spell_engine",
+        help="'pyspellchecker' or the precomputed 'symspell' index, built in ./data/symspell on first use. Default is 'pyspellchecker'",
+        choices=['pyspellchecker', 'symspell'],
+        default='pyspellchecker'
+        )
+
+    # Merge strategy
+    parser.add_argument(
+        "--merge_strategy",
+        help="Merge pages by aligning 'characters' or whole 'words'. Default is 'characters'",
+        choices=['characters', 'words'],
+        default='characters'
+        )
+
+    # Overlap fast path
+    parser.add_argument(
+        "--fast_overlap",
+        help="Find the seam from line anchors and align within a band around it, falling back to the full alignment",
+        action='store_true'
+        )
+
+    # Metrics
+    parser.add_argument(
+        "--plot",
+        help="Show a box plot of the stage timings at the end of the run",
+        action='store_true'
+        )
+    parser.add_argument(
+        "--metrics",
+        help="Write periodic JSON snapshots of the stage timings and counters to this file",
+        default=None,
+        type=str
+        )
+    parser.add_argument(
+        "--prometheus",
+        help="Write periodic Prometheus textfile snapshots to this file",
+        default=None,
+        type=str
+        )
+    metrics_interval = 10.
+    parser.add_argument(
+        "--metrics_interval",
+        help=f"Seconds between metric snapshots, default is {metrics_interval}",
+        default=metrics_interval,
+        type=float
+        )
+    parser.add_argument(
+        "--no_metrics",
+        help="Disable the stage timers entirely",
+        action='store_true'
+        )
+
+    # Startup
+    parser.add_argument(
+        "--profile_startup",
+        help="Print import and initialisation times per module before capturing",
+        action='store_true'
+        )
+
+    # Sampling profiler
+    parser.add_argument(
+        "--profile",
+        help="Sample the stacks of all threads during capture and write per stage flamegraphs to PREFIX.speedscope.json and PREFIX.STAGE.folded",
+        metavar="PREFIX",
+        default=None,
+        type=str
+        )
+    profile_interval = .005
+    parser.add_argument(
+        "--profile_interval",
+        help=f"Seconds between profiler samples, default is {profile_interval}",
+        default=profile_interval,
+        type=float
+        )
+
+    # Record or replay
+    parser.add_argument(
+        "--record",
+        help="Record every grabbed frame and scroll to this session directory",
+        default=None,
+        type=str
+        )
+    parser.add_argument(
+        "--settle",
+        help="After scrolling, poll the region until it stops changing instead of sleeping, adapting to the measured render latency",
+        action='store_true'
+        )
+    settle_timeout = 1.
+    parser.add_argument(
+        "--settle_timeout",
+        help=f"Longest wait for a region to settle in seconds, default is {settle_timeout}",
+        default=settle_timeout,
+        type=float
+        )
+    parser.add_argument(
+        "--replay",
+        help="Replay a recorded session directory instead of reading the screen",
+        default=None,
+        type=str
+        )
+
+    # Several regions
+    parser.add_argument(
+        "--region",
+        help="Watch a named region instead of screen_rect, as NAME=X,Y,W,H or NAME=X,Y,W,H,PRIORITY, followed by :FINAL TEXT to end the region on its own last words instead of --final_text. Repeat for more regions, each is written to NAME.txt",
+        action='append',
+        default=[],
+        type=parse_region
+        )
+    parser.add_argument(
+        "--schedule",
+        help="Capture the regions in turn with 'round_robin', or as often as their PRIORITY with 'priority'. Default is 'round_robin'",
+        choices=['round_robin', 'priority'],
+        default='round_robin'
+        )
+
+    # Loop mode
+    parser.add_argument(
+        "--mode",
+        help="'sequential' runs grab, OCR and merge one after another, 'pipelined' overlaps them. Default is 'sequential'",
+        choices=['sequential', 'pipelined'],
+        default='sequential'
+        )
+
+    # OCR engine
+    parser.add_argument(
+        "--ocr_engine",
+        help="OCR backend, 'auto' uses persistent tesserocr workers when installed and pytesseract otherwise. Default is 'auto'",
+        choices=['auto', *ENGINES],
+        default='auto'
+        )
+
+    # OCR language
+    parser.add_argument(
+        "--lang",
+        help="Tesseract language code, default is 'eng'",
+        default='eng',
+        type=str
+        )
+
+    # OCR workers
+    workers = 2
+    parser.add_argument(
+        "--workers",
+        help=f"Number of OCR workers, default is {workers}",
+        default=workers,
+        type=int
+        )
+
+    # Preprocessing
+    parser.add_argument(
+        "--preprocess",
+        help="Clean up frames before OCR: 'gray', 'binary' (adaptive threshold, trimmed margins) or 'binary2x'/'binary3x' (also enlarged). Default is 'none'",
+        choices=list(PRESETS),
+        default='none'
+        )
+
+    # Word confidences
+    parser.add_argument(
+        "--confidence",
+        help="Read word confidences from tesseract, words read with at least this confidence (0-100) are trusted without spell checking. Default is 0, plain text",
+        default=0,
+        type=float
+        )
+
+    # OCR tiling
+    parser.add_argument(
+        "--tiles",
+        help="Cut every frame into this many bands of text lines and OCR them in parallel, for tall regions. Default is 1",
+        default=1,
+        type=int
+        )
+
+    # Output
+    fsync_every = 1
+    parser.add_argument(
+        "--fsync_every",
+        help=f"Sync the output file and its checkpoint every this many pages, default is {fsync_every}",
+        default=fsync_every,
+        type=int
+        )
+    parser.add_argument(
+        "--jsonl",
+        help="Also write a JSONL record per page",
+        action='store_true'
+        )
+    parser.add_argument(
+        "--resume",
+        help="Continue an interrupted capture from its checkpoint",
+        action='store_true'
+        )
+
     # Bounding box
     parser.add_argument(
         "screen_rect",
         help="x y w h coördinates of the bounding box to screen grab",
         nargs ="*",
         type=int,
-        default=[0, 0, screen_width, screen_height]
+        default=[]
         )
-    args=parser.parse_args()
+    return parser
+
+def main():
+    """
+    Do some rudimentary command line argument handling
+    so the user can speicify the area of the screen to watch
+    """
+    EXE = sys.argv[0]
+
+    # Parse CL arguments
+    args=build_parser().parse_args()
+
+    # Load the heavy parts in the background during the countdown
+    profile = StartupProfile()
+    warming = ThreadPoolExecutor(max_workers=1, thread_name_prefix='warmup').submit(warmup, args, profile)
+
+    with profile.measure('Backend'):
+        backend = get_backend(args)
+
+    # Default to the recorded region, or the whole screen
+    if not args.screen_rect and not args.region:
+        if args.replay:
+            args.screen_rect = backend.rect
+        else:
+            with profile.measure('Screen size'):
+                args.screen_rect = [0, 0, *screensize()]
 
     # Check the arguments
-    if len(args.screen_rect) != 4:
+    if not args.region and len(args.screen_rect) != 4:
         sys.stderr.write(
             EXE +
             ": monitors section of screen for text\n"
@@ -159,8 +825,8 @@ def main():
             )
         sys.exit(1)
 
-    # Countdown
-    downfrom = 5
+    # Countdown, replays do not need time to switch windows
+    downfrom = 0 if args.replay else 5
     if args.verbose:
         print(f'Verbose is {args.verbose}')
     for i in range(downfrom, 0, -1):
@@ -168,7 +834,47 @@ def main():
         time.sleep(1)
     print()
 
-    sequential(args)
+    if args.no_metrics:
+        tracker.disable()
+    elif args.metrics or args.prometheus:
+        tracker.export_every(args.metrics_interval, args.metrics, args.prometheus)
+
+    # Wait for whatever the countdown did not cover
+    with profile.measure('Waiting for warm-up'):
+        engine = warming.result()
+    profile.mark('Ready to capture')
+
+    if args.profile_startup:
+        print(profile.report(import_times()), flush=True)
+
+    profiler = None
+    if args.profile:
+        profiler = SamplingProfiler(args.profile_interval)
+        profiler.start()
+
+    try:
+        if args.region:
+            multiregion(args, engine, backend)
+        elif args.mode == 'pipelined':
+            pipelined(args, engine, backend)
+        else:
+            sequential(args, engine, backend)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        engine.close()
+
+        if profiler is not None:
+            profiler.save(args.profile)
+            if args.verbose:
+                print(profiler.report())
+
+        # Final metrics
+        tracker.tick(force=True)
+        if args.verbose:
+            print(tracker.report())
+        if args.plot:
+            tracker.boxplot()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,118 @@
+"""Streaming output sinks for the merged document."""
+import os
+import json
+import time
+
+from controls import datafolder, load_checkpoint
+
+class Sink():
+    """
+    Receives the document page by page.
+    `committed` is text that will not change anymore, `tail` is the part that still can.
+    """
+    def update(self, committed, tail, page, ocr):
+        pass
+
+    def close(self, tail):
+        pass
+
+class TextSink(Sink):
+    """
+    Append committed text to `<datafolder><title>.txt` instead of rewriting the whole file.
+    Every `fsync_every` pages the file is synced and a sidecar checkpoint holding
+    the committed byte offset and the uncommitted tail is replaced atomically,
+    so an interrupted capture can be resumed with `load_txt` or `resume`.
+    """
+    def __init__(self, title, fsync_every=1, resume=False):
+        self.path = f"{datafolder}{title}.txt"
+        self.checkpoint_path = f"{datafolder}{title}.ckpt.json"
+        self.fsync_every = fsync_every
+        self.pending = 0
+
+        os.makedirs(datafolder, exist_ok=True)
+        checkpoint = load_checkpoint(title) if resume else None
+        if checkpoint is None:
+            self.file = open(self.path, 'wb')
+        else:
+            # Drop whatever was written after the last checkpoint
+            self.file = open(self.path, 'r+b')
+            self.file.truncate(checkpoint['offset'])
+            self.file.seek(checkpoint['offset'])
+
+    def update(self, committed, tail, page, ocr):
+        if committed:
+            self.file.write(committed.encode('utf-8'))
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync(tail, page)
+
+    def sync(self, tail, page=None):
+        """Make the committed text durable, then record it in the checkpoint"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+        checkpoint = {'offset': self.file.tell(), 'tail': tail, 'page': page}
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.checkpoint_path)
+
+    def close(self, tail):
+        self.file.write(tail.encode('utf-8'))
+        self.sync("")
+        self.file.close()
+
+class JsonlSink(Sink):
+    """Append one JSON record per page to `<datafolder><title>.jsonl`"""
+    def __init__(self, title, fsync_every=1, resume=False):
+        self.path = f"{datafolder}{title}.jsonl"
+        self.fsync_every = fsync_every
+        self.pending = 0
+
+        os.makedirs(datafolder, exist_ok=True)
+        self.file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    def update(self, committed, tail, page, ocr):
+        record = {
+            'page': page,
+            'time': time.time(),
+            'ocr': ocr,
+            'committed': len(committed),
+            'tail': len(tail),
+            }
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+
+    def close(self, tail):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+class MultiSink(Sink):
+    """Fan out to several sinks"""
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+
+    def update(self, committed, tail, page, ocr):
+        for sink in self.sinks:
+            sink.update(committed, tail, page, ocr)
+
+    def close(self, tail):
+        for sink in self.sinks:
+            sink.close(tail)
+
+def resume(title):
+    """Committed text and uncommitted tail of an interrupted capture, or None"""
+    checkpoint = load_checkpoint(title)
+    if checkpoint is None:
+        return None
+    with open(f"{datafolder}{title}.txt", 'rb') as f:
+        committed = f.read(checkpoint['offset']).decode('utf-8')
+    return committed, checkpoint['tail']
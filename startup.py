@@ -0,0 +1,63 @@
+"""Startup profiling: per-package import times and timed initialisation steps."""
+import os
+import sys
+import time
+import threading
+import subprocess
+from contextlib import contextmanager
+
+class StartupProfile():
+    """Collects how long each initialisation step took and on which thread"""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, label):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings.append((label, elapsed, threading.current_thread().name))
+
+    def mark(self, label):
+        """Record the time since the profile was created"""
+        with self._lock:
+            self.timings.append((label, time.perf_counter() - self.started, 'total'))
+
+    def report(self, imports=None):
+        lines = []
+        if imports:
+            lines.append(f"{'import':<40}{'self':>10}")
+            for package, seconds in imports:
+                lines.append(f"{package:<40}{1000*seconds:>8.1f}ms")
+            lines.append("")
+        lines.append(f"{'step':<40}{'time':>10}  thread")
+        for label, seconds, thread in self.timings:
+            lines.append(f"{label:<40}{1000*seconds:>8.1f}ms  {thread}")
+        return '\n'.join(lines)
+
+def import_times(module='run', top=15):
+    """
+    Import time per top-level package when importing `module` in a fresh
+    interpreter, from Python's own `-X importtime` output.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        totals[package] = totals.get(package, 0.) + int(own) / 1e6
+
+    return sorted(totals.items(), key=lambda item: -item[1])[:top]
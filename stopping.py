@@ -0,0 +1,63 @@
+"""End-of-document detection with a bit-parallel approximate matcher."""
+from matching import ApproximateMatcher
+
+def approximate_contains(text:str, pattern:str, max_errors:int) -> bool:
+    """True if `pattern` occurs in `text` with at most `max_errors` edits"""
+    return ApproximateMatcher(pattern, max_errors).search(text) >= 0
+
+class StopDetector():
+    """
+    Decide when the capture has reached the end of the document.
+    The document has ended when the known `final_text` shows up in the merged
+    text, or when the last `tail_fraction` of a page repeats the tail of the
+    previous page, that is the page did not scroll any more. Both allow
+    `max_error` errors per character of the searched text.
+    Only text merged since the previous check is scanned for the final text,
+    from where the merge started rewriting the document, plus enough overlap
+    to catch a match straddling the seam.
+    """
+    def __init__(self, final_text=None, max_error=.1, tail_fraction=.1):
+        self.max_error = max_error
+        self.tail_fraction = tail_fraction
+        self.final = None
+        if final_text:
+            self.final = ApproximateMatcher(final_text, int(max_error*len(final_text)))
+        self.scanned = 0
+        self.previous = ""
+        self.reason = None
+
+    def final_text_seen(self, document) -> bool:
+        """Scan the text merged since the last call for the final text"""
+        if self.final is None:
+            return False
+        start = min(document.rewritten(), self.scanned)
+        start = max(0, start - self.final.length - self.final.max_errors)
+        self.scanned = len(document)
+        return self.final.search(document.since(start)) >= 0
+
+    def tail_repeated(self, ocr:str) -> bool:
+        """Compare the tail of this page's text to the previous page's"""
+        if not self.tail_fraction:
+            return False
+        tail = ocr[len(ocr) - int(self.tail_fraction*len(ocr)):]
+        previous, self.previous = self.previous, tail
+        if not tail or not previous:
+            return False
+        return approximate_contains(previous, tail, int(self.max_error*len(tail)))
+
+    def stalled(self) -> bool:
+        """
+        Call when grabs stopped changing. A page that no longer moves repeats its
+        tail, so this only ends the document when the tail check is on.
+        """
+        if self.tail_fraction:
+            self.reason = 'page stopped scrolling'
+        return self.reason is not None
+
+    def check(self, document, ocr:str) -> bool:
+        """Call once per merged page, True when the end has been reached"""
+        if self.final_text_seen(document):
+            self.reason = 'final text'
+        elif self.tail_repeated(ocr):
+            self.reason = 'tail repeated'
+        return self.reason is not None
@@ -0,0 +1,155 @@
+"""Precomputed symmetric-delete spelling index, a drop-in for `SpellChecker` lookups."""
+import os
+import zlib
+import json
+import hashlib
+from array import array
+
+import numpy as np
+import Levenshtein
+
+from controls import datafolder
+
+def deletes(word:str, max_distance:int) -> set[str]:
+    """Every string reachable from `word` by deleting up to `max_distance` characters"""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i+1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+def key(text:str) -> int:
+    """Stable 64-bit hash, unlike `hash` it is the same in every process"""
+    data = text.encode('utf-8')
+    return zlib.crc32(data) << 32 | zlib.crc32(data, 0x9E3779B9)
+
+class SymSpellIndex():
+    """
+    SymSpell-style correction engine.
+    Every dictionary word is indexed under the deletions of its first
+    `prefix_length` characters, so looking up a word only needs the deletions
+    of the word itself instead of generating all edits up to `max_distance`.
+    The index is a handful of flat NumPy arrays that are memory-mapped from
+    disk, so loading a built index takes milliseconds.
+    """
+    files = ('keys', 'values', 'counts', 'offsets', 'words')
+
+    def __init__(self, keys, values, counts, offsets, words, max_distance=2, prefix_length=7):
+        self.keys = keys          # sorted delete hashes
+        self.values = values      # word index per delete hash
+        self.counts = counts      # word frequency
+        self.offsets = offsets    # byte offsets into `words`
+        self.words = words        # utf-8 encoded words, back to back
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+
+    @classmethod
+    def build(cls, frequencies:dict, max_distance=2, prefix_length=7):
+        """Build the index from a word -> count mapping"""
+        vocabulary = sorted(frequencies)
+        keys = array('Q')
+        values = array('I')
+        for index, word in enumerate(vocabulary):
+            for delete in deletes(word[:prefix_length], max_distance):
+                keys.append(key(delete))
+                values.append(index)
+
+        keys = np.frombuffer(keys, dtype=np.uint64)
+        values = np.frombuffer(values, dtype=np.uint32)
+        order = np.argsort(keys, kind='stable')
+
+        encoded = [w.encode('utf-8') for w in vocabulary]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(w) for w in encoded], out=offsets[1:])
+
+        return cls(
+            keys[order],
+            values[order],
+            np.array([frequencies[w] for w in vocabulary], dtype=np.int64),
+            offsets,
+            np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            max_distance=max_distance,
+            prefix_length=prefix_length,
+            )
+
+    def save(self, path):
+        """Write the arrays as .npy files plus a small JSON header"""
+        os.makedirs(path, exist_ok=True)
+        for name in self.files:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(path, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump({'max_distance': self.max_distance, 'prefix_length': self.prefix_length}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a saved index"""
+        with open(os.path.join(path, 'index.json'), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in cls.files]
+        return cls(*arrays, **header)
+
+    @classmethod
+    def for_language(cls, language='nl', custom_vocab=None, max_distance=2, prefix_length=7, cache=None):
+        """
+        Load the index for a pyspellchecker language plus custom vocabulary
+        from the cache, building and saving it on the first run.
+        """
+        custom_vocab = sorted(set(custom_vocab or []))
+        digest = hashlib.sha1('\n'.join([language, str(max_distance), str(prefix_length), *custom_vocab]).encode('utf-8')).hexdigest()[:12]
+        path = os.path.join(cache or os.path.join(datafolder, 'symspell'), f'{language}-{digest}')
+
+        if os.path.exists(os.path.join(path, 'index.json')):
+            return cls.load(path)
+
+        from spellchecker import SpellChecker
+        spell = SpellChecker(language=language, distance=max_distance)
+        if custom_vocab:
+            spell.word_frequency.load_words(custom_vocab)
+        index = cls.build(spell.word_frequency.dictionary, max_distance, prefix_length)
+        index.save(path)
+        return cls.load(path)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def word(self, index:int) -> str:
+        return bytes(self.words[self.offsets[index]:self.offsets[index+1]]).decode('utf-8')
+
+    def _lookup(self, hashes):
+        """Word indices filed under any of `hashes`"""
+        hashes = np.array(sorted(hashes), dtype=np.uint64)
+        left = np.searchsorted(self.keys, hashes, side='left')
+        right = np.searchsorted(self.keys, hashes, side='right')
+        found = [self.values[l:r] for l, r in zip(left, right) if r > l]
+        if not found:
+            return np.empty(0, dtype=np.uint32)
+        return np.unique(np.concatenate(found))
+
+    def __contains__(self, word:str) -> bool:
+        word = word.lower()
+        return any(self.word(i) == word for i in self._lookup([key(word[:self.prefix_length])]))
+
+    def candidates(self, word:str, max_distance=None) -> list[tuple[str, int, int]]:
+        """Known words within `max_distance` of `word`, as (word, distance, count)"""
+        if max_distance is None:
+            max_distance = self.max_distance
+        word = word.lower()
+        prefix = word[:self.prefix_length]
+
+        found = []
+        for index in self._lookup({key(d) for d in deletes(prefix, max_distance)}):
+            candidate = self.word(index)
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+            distance = Levenshtein.distance(word, candidate, score_cutoff=max_distance)
+            if distance <= max_distance:
+                found.append((candidate, distance, int(self.counts[index])))
+        return found
+
+    def correction(self, word:str):
+        """The closest, then most frequent, known word, or None, like `SpellChecker.correction`"""
+        found = self.candidates(word)
+        if not found:
+            return None
+        return min(found, key=lambda c: (c[1], -c[2]))[0]
@@ -0,0 +1,110 @@
+import random
+import time
+
+from Bio import Align
+
+import error_correction
+from error_correction import OCRMerger, join_with_newlines, split_keep_newlines
+
+class Dictionary(set):
+    """Spell engine without suggestions, so arbitration stays cheap next to building the lattice"""
+    def correction(self, word):
+        return None
+
+def noisy_copy(text, rate, rng):
+    """
+    `text` with a share `rate` of its letters misread as letters the words never use,
+    so no misread word is in the dictionary: mostly substituted, some doubled
+    """
+    misread = []
+    for c in text:
+        r = rng.random()
+        if not c.isalpha() or r >= rate:
+            misread.append(c)
+        elif r < .8*rate:
+            misread.append(rng.choice('klmnopqrst'))
+        else:
+            misread.append(c + rng.choice('klmnopqrst'))
+    return ''.join(misread)
+
+def alignment(str1, str2):
+    """The alignment `align_sequences` makes with its default scores"""
+    Aligner = Align.PairwiseAligner(mode='global', match_score=2, mismatch_score=-1)
+    Aligner.open_gap_score = -.5
+    Aligner.extend_gap_score = -.1
+    Aligner.target_end_gap_score = 0.0
+    Aligner.query_end_gap_score = 0.0
+    return next(iter(Aligner.align(str1, str2)))
+
+def amalgamations(str1, str2, indices1, indices2, start1, fin2):
+    """Every reading of the aligned region, one branch per mismatched column"""
+    readings = ['']
+    for i1, i2 in zip(indices1, indices2):
+        if i1<start1 or i2>fin2:
+            continue
+        for a, amalg in enumerate(readings.copy()):
+            if i1>=0:
+                if i2>=0 and str1[i1] != str2[i2]:
+                    readings.append(amalg + str2[i2])
+                readings[a] = amalg + str1[i1]
+            elif i2>=0:
+                readings[a] = amalg + str2[i2]
+    return readings
+
+def test_align_sequences_is_linear_in_mismatches(monkeypatch):
+    rng = random.Random(3)
+    words = [''.join(rng.choice('abcdefghij') for _ in range(rng.randint(2, 8))) for _ in range(1000)]
+    merger = OCRMerger()
+    merger.spell = Dictionary(words)
+
+    # Time the lattice the merge builds, the alignment itself is quadratic in the window
+    lattices, timings = [], []
+    word_lattice = error_correction.word_lattice
+    def timed_lattice(*args):
+        start = time.perf_counter()
+        lattice = word_lattice(*args)
+        timings.append(time.perf_counter() - start)
+        lattices.append(lattice)
+        return lattice
+    monkeypatch.setattr(error_correction, 'word_lattice', timed_lattice)
+
+    def merge(size):
+        str1 = ' '.join(words)[:size]
+        # The edges of the alignment hold one reading only, so misread just the words in between
+        first, _, rest = str1.partition(' ')
+        middle, _, last = rest.rpartition(' ')
+        str2 = ' '.join((first, noisy_copy(middle, .3, rng), last))
+        fastest = float('inf')
+        for _ in range(3):
+            lattices.clear()
+            timings.clear()
+            merged = merger.align_sequences(str1, str2)
+            assert len(lattices) == 1
+            fastest = min(fastest, timings[0])
+        return str1, merged, fastest
+
+    small = merge(1000)[2]
+    str1, merged, large = merge(4000)
+
+    # Hundreds of slots read two ways, merged back to the dictionary words in milliseconds
+    assert sum(len(slot) == 2 for slot in lattices[0]) > 200
+    assert merged == str1
+    assert large < .05
+    assert large < 10*small
+
+def test_align_sequences_matches_branching_merge():
+    merger = OCRMerger()
+    str1 = 'de kat zit op de mat\nen de hond ligt in de mand'
+    str2 = 'de kat zlt op de mat\nen de hond ligt ln de rnand bij het vuur'
+
+    aligned = alignment(str1, str2)
+    indices1, indices2 = (i.tolist() for i in aligned.indices)
+    start1, fin2 = aligned.aligned[0][0, 0], aligned.aligned[1][-1, -1]
+
+    readings = [split_keep_newlines(a) for a in amalgamations(str1, str2, indices1, indices2, start1, fin2)]
+    assert len(readings) > 2
+    expected = split_keep_newlines(str1[:start1])
+    expected.extend(merger.choose_best_word_among(*w) for w in zip(*readings))
+    expected.extend(split_keep_newlines(str2[fin2:]))
+
+    assert merger.align_sequences(str1, str2) == join_with_newlines(expected)
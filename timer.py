@@ -1,58 +1,260 @@
+import os
 import time
-import matplotlib.pyplot as plt
-import numpy as np
+import math
+import json
+import functools
+import threading
+from contextlib import contextmanager
+
+class streamstats():
+    """
+    Constant-memory statistics of a stream of durations.
+    Count, mean and variance are updated with Welford's method, quantiles come
+    from a logarithmic bucket sketch whose estimates are within `accuracy`
+    relative error.
+    """
+    def __init__(self, accuracy=.01, floor=1e-9):
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = math.inf
+        self.max = -math.inf
+        self.total = 0.
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.floor = floor
+        self.zeros = 0
+        self.buckets = {}
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.total += x
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+        if x <= self.floor:
+            self.zeros += 1
+        else:
+            i = math.ceil(math.log(x) / self.log_gamma)
+            self.buckets[i] = self.buckets.get(i, 0) + 1
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.n) if self.n else 0.
+
+    def quantile(self, q):
+        if self.n == 0:
+            return math.nan
+        rank = q * (self.n - 1)
+        seen = self.zeros
+        if rank < seen:
+            return max(self.min, 0.)
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if rank < seen:
+                estimate = 2 * self.gamma**i / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.n,
+            'total': self.total,
+            'mean': self.mean,
+            'std': self.std,
+            'min': self.min if self.n else math.nan,
+            'max': self.max if self.n else math.nan,
+            'p50': self.quantile(.5),
+            'p95': self.quantile(.95),
+            'p99': self.quantile(.99),
+            }
+
+def _noop(*args, **kwargs):
+    pass
 
 class timetrack():
-    def __init__(self, timer=time.perf_counter):
+    def __init__(self, timer=time.perf_counter, enabled=True):
         self.timer = timer
         self.times = {}
         self.starts = {}
+        self.counts = {}
+        self.active = {}
+        self.exports = None
+        if not enabled:
+            self.disable()
+
+    def disable(self):
+        """Turn start, stop, add and count into no-ops"""
+        self.start = self.stop = self.add = self.count = self.tick = _noop
+
+    def enable(self):
+        for name in ('start', 'stop', 'add', 'count', 'tick'):
+            self.__dict__.pop(name, None)
+
+    def reset(self):
+        """Forget all timings and counts"""
+        self.times = {}
+        self.starts = {}
+        self.counts = {}
+        self.active = {}
 
     def start(self, prop):
+        self.active.setdefault(threading.get_ident(), []).append(prop)
         self.starts[prop] = self.timer()
 
     def stop(self, prop):
         # Check if `start` has been called
         if prop not in self.starts:
             raise RuntimeError(f"`stop('{prop}')` called before `start('{prop}')`")
-        
-        stop = self.timer()
+
+        self.add(prop, self.timer() - self.starts[prop])
+
+        # Labels nest, so this is nearly always the innermost one
+        labels = self.active.get(threading.get_ident())
+        if labels:
+            for i in range(len(labels)-1, -1, -1):
+                if labels[i] == prop:
+                    del labels[i]
+                    break
+
+    def label(self, thread):
+        """The innermost running label on thread id `thread`, for the sampling profiler"""
+        # The thread may pop its label while we look
+        try:
+            return self.active[thread][-1]
+        except (KeyError, IndexError):
+            return None
+
+    def add(self, prop, elapsed):
+        """Record a duration measured elsewhere"""
         if prop not in self.times:
-            self.times[prop] = [ stop - self.starts[prop] ]
-        else:
-            self.times[prop].append( stop - self.starts[prop])
+            self.times[prop] = streamstats()
+        self.times[prop].add(elapsed)
+
+    def count(self, prop, n=1):
+        self.counts[prop] = self.counts.get(prop, 0) + n
+
+    @contextmanager
+    def measure(self, prop):
+        """`with tracker.measure('label'):` times the block"""
+        self.start(prop)
+        try:
+            yield
+        finally:
+            self.stop(prop)
+
+    def timed(self, prop=None):
+        """Decorator timing every call, under the function's name by default"""
+        def decorator(func):
+            label = prop or func.__qualname__
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.measure(label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        return {
+            'time': time.time(),
+            'timings': {label: stats.summary() for label, stats in self.times.items()},
+            'counts': dict(self.counts),
+            }
+
+    def report(self):
+        """Plain-text table of the timings and counts"""
+        lines = [f"{'label':<45}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}"]
+        for label, stats in self.times.items():
+            s = stats.summary()
+            lines.append(
+                f"{label:<45}{s['count']:>8}{1000*s['mean']:>8.1f}ms"
+                f"{1000*s['p50']:>8.1f}ms{1000*s['p95']:>8.1f}ms{1000*s['p99']:>8.1f}ms"
+                )
+        for label, n in self.counts.items():
+            lines.append(f"{label:<45}{n:>8}")
+        return '\n'.join(lines)
+
+    def export_json(self, path):
+        _write_atomic(path, json.dumps(self.snapshot(), indent=1))
+
+    def export_prometheus(self, path, prefix='ocr'):
+        """Write a Prometheus textfile-collector snapshot"""
+        lines = [
+            f'# TYPE {prefix}_stage_seconds summary',
+            ]
+        for label, stats in self.times.items():
+            s = stats.summary()
+            for q in ('p50', 'p95', 'p99'):
+                quantile = int(q[1:]) / 100
+                lines.append(f'{prefix}_stage_seconds{{stage="{_escape(label)}",quantile="{quantile}"}} {s[q]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{_escape(label)}"}} {s["total"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{_escape(label)}"}} {s["count"]}')
+        lines.append(f'# TYPE {prefix}_events_total counter')
+        for label, n in self.counts.items():
+            lines.append(f'{prefix}_events_total{{event="{_escape(label)}"}} {n}')
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
+    def export_every(self, interval, json_path=None, prometheus_path=None):
+        """Have `tick` write snapshots at most every `interval` seconds"""
+        self.exports = {
+            'interval': interval,
+            'json': json_path,
+            'prometheus': prometheus_path,
+            'last': -math.inf,
+            }
+
+    def tick(self, force=False):
+        """Call once per loop, writes the periodic snapshots when they are due"""
+        if self.exports is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.exports['last'] < self.exports['interval']:
+            return
+        self.exports['last'] = now
+        if self.exports['json']:
+            self.export_json(self.exports['json'])
+        if self.exports['prometheus']:
+            self.export_prometheus(self.exports['prometheus'])
 
     def boxplot(self, show=True):
-        labels = list(self.times.keys())
-        data = list(self.times.values())
+        """Box plot of the sketched distributions, for the end of a run"""
+        import matplotlib.pyplot as plt
 
         # Ignore empty entries
-        empty = [i for i, d in enumerate(data) if len(d) == 0]
-        for i in reversed(empty):
-            data.pop(i)
-            labels.pop(i)
+        items = [(label, stats) for label, stats in self.times.items() if stats.n > 0]
+        labels = [label for label, _ in items]
 
         n = len(labels)
         fig, ax = plt.subplots(figsize=(max(6, n*1.2), 5))
 
-        # Create boxplot with mean markers
-        bp = ax.boxplot(
-            data,
-            labels=labels,
-            vert=True,
+        # Boxes from the quantile sketch, with mean markers
+        boxes = [
+            {
+                'label': label,
+                'med': stats.quantile(.5),
+                'q1': stats.quantile(.25),
+                'q3': stats.quantile(.75),
+                'whislo': stats.quantile(.01),
+                'whishi': stats.quantile(.99),
+                'mean': stats.mean,
+                'fliers': [],
+            }
+            for label, stats in items
+        ]
+        ax.bxp(
+            boxes,
             patch_artist=True,
             showmeans=True,
             meanprops={'marker':'D', 'mfc':'white', 'mec':'black'}
         )
 
         # Add ±1σ horizontal lines
-        for i, (label, values) in enumerate(self.times.items(), 1):
-            mean = np.mean(values)
-            std = np.std(values)
-
-            # Add horizontal lines for mean ±1σ
+        for i, (label, stats) in enumerate(items, 1):
             ax.hlines(
-                [mean - std, mean + std],
+                [stats.mean - stats.std, stats.mean + stats.std],
                 xmin=i-0.4, xmax=i+0.4,  # Match default box width
                 colors='red',
                 linestyles='dashed',
@@ -64,8 +266,21 @@ class timetrack():
         plt.tight_layout()
 
         if show:
-            fig.show()
+            plt.show()
 
         return fig
 
+def _escape(label):
+    return label.replace('\\', '\\\\').replace('"', '\\"')
+
+def _write_atomic(path, text):
+    """Replace `path` in one step, so readers never see half a file"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temporary, path)
+
 tracker = timetrack()